@@ -1,25 +1,92 @@
 import os # Import os module
+import glob
+import logging
+import atexit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import orjson
 from flask import Flask
 from flask_cors import CORS
+from flask_compress import Compress
 
-def create_app():
+from .routes.yaml_routes import yaml_bp, start_temp_sweeper
+from .services.yaml_service import warm_cache
+
+try:
+    from flask.json.provider import JSONProvider
+except ImportError: # Flask < 2.2 has no pluggable JSON provider
+    JSONProvider = None
+
+if JSONProvider is not None:
+    class OrjsonProvider(JSONProvider):
+        """JSON provider backed by orjson, so jsonify and request.json encode/decode in C."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+def create_app(config=None):
     """
     Create and configure the Flask application.
     
+    Args:
+        config: Optional mapping of Flask config overrides, e.g. {'TESTING': True} to skip the
+            background temp sweeper and cache warm-up. TESTING can also be set with FLASK_TESTING=1.
+    
     Returns:
         Configured Flask application
     """
+    # Per-request diagnostics are logged at DEBUG; set LOG_LEVEL=DEBUG to see them
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+
     app = Flask(__name__)
+    app.config['TESTING'] = os.environ.get('FLASK_TESTING', '').lower() in ('1', 'true', 'yes')
+    if config:
+        app.config.update(config)
 
     # Set a secret key for session management
     # IMPORTANT: Use a strong, unique secret in production, possibly from environment variables
     app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-replace-in-prod')
+
+    # Reject oversized request bodies before they are buffered or decoded
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+
+    # Route every jsonify/request.json through orjson where Flask supports it
+    if JSONProvider is not None:
+        app.json = OrjsonProvider(app)
+    
+    # Configure CORS once for every route (including preflights); views never set CORS headers themselves
+    CORS(app, supports_credentials=True, origins=["http://localhost:3000","https://network-visualizer-36300.web.app"], # Adjust origin if your frontend runs elsewhere
+         methods=["GET", "POST", "OPTIONS"], allow_headers=["Content-Type"])
     
-    # Configure CORS more explicitly to allow credentials
-    CORS(app, supports_credentials=True, origins=["http://localhost:3000","https://network-visualizer-36300.web.app"]) # Adjust origin if your frontend runs elsewhere
+    # Compress large JSON responses (parsed configs are mostly repeated keys)
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    Compress(app)
+    
+    # One worker pool per process for reference parsing, instead of spawning threads per request
+    app.yaml_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4), thread_name_prefix='yaml')
+    atexit.register(app.yaml_pool.shutdown, wait=False, cancel_futures=True)
+    # Image cropping is CPU-bound (numpy/lxml hold the GIL), so it runs in worker processes instead
+    app.crop_pool = ProcessPoolExecutor(max_workers=int(os.environ.get('CROP_WORKERS', 2)))
+    atexit.register(app.crop_pool.shutdown, wait=False, cancel_futures=True)
+    # Large YAML documents are parsed in worker processes too, so one big parse doesn't stall every request thread
+    app.parse_pool = ProcessPoolExecutor(max_workers=int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1)))
+    atexit.register(app.parse_pool.shutdown, wait=False, cancel_futures=True)
     
     # Register blueprints
-    from .routes.yaml_routes import yaml_bp
     app.register_blueprint(yaml_bp)
+
+    # Sweep stale temp files in the background instead of before every upload
+    if not app.config.get('TESTING'):
+        app.temp_sweeper_stop = start_temp_sweeper()
+
+    # Pre-parse the configs matched by YAML_WARM_GLOB (if set) once per process so /parse serves them from cache
+    warm_glob = os.environ.get('YAML_WARM_GLOB')
+    if warm_glob and not app.config.get('TESTING'):
+        warmed = warm_cache(sorted(glob.glob(warm_glob)))
+        if warmed:
+            app.logger.info("Warmed YAML cache with %d config(s) from %s", warmed, warm_glob)
     
     return app
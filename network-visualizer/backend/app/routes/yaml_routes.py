@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, make_response # Import make_response
+from flask import Blueprint, Response, current_app, request
 from werkzeug.utils import secure_filename
 import os
 import tempfile # Still needed for local extraction before GCS upload
@@ -6,52 +6,93 @@ import traceback
 import shutil
 import zipfile
 import io
-import glob # May still be useful for local temp processing
+import posixpath
 import yaml
 import uuid # For generating unique upload IDs
 import base64 # For image data processing
-from google.cloud import storage # Import GCS client
+import logging
+import time
+import orjson # Fast JSON encoding for large config responses
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from stream_unzip import stream_unzip # Extracts zip members as the request body arrives
 
 from ..services.yaml_service import (
-    parse_yaml_content,
+    parse_yaml_content_cached,
     process_yaml_file, # This function will need significant changes
     fetch_yaml_file,
     find_all_config_references, # This might need GCS adaptation
-    find_config_references # This might need GCS adaptation
+    find_all_config_references_in_content,
+    find_zip_config_references,
+    find_config_references, # This might need GCS adaptation
+    cleanup_local_sidecars,
+    invalidate_upload_cache,
+    prime_upload_texts,
+    is_preset_upload_id,
+    PRESETS_PATH,
+    PRESET_UPLOAD_ID_PREFIX
 )
 
-from ..services.image_service import crop_image
+from ..services.image_service import crop_image_data, image_size, process_image_data
+
+logger = logging.getLogger(__name__)
 
 # --- GCS Configuration ---
 # Get bucket name from environment variable
 GCS_BUCKET_NAME = os.environ.get('GCS_BUCKET_NAME')
 if not GCS_BUCKET_NAME:
-    print("WARNING: GCS_BUCKET_NAME environment variable not set.")
+    logger.warning("GCS_BUCKET_NAME environment variable not set.")
     # Optionally, raise an error or use a default for local dev?
     # raise ValueError("GCS_BUCKET_NAME environment variable is required.")
 
-# Define the path for pre-uploaded configurations
-PRESETS_PATH = os.environ.get('PRESETS_PATH', 'presets/')
-
 # Define a temporary directory for file uploads
 TEMP_UPLOAD_DIR = os.environ.get('TEMP_UPLOAD_DIR', '/tmp/yaml_uploads')
 # Ensure the directory exists
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
 
-# Initialize GCS client (consider initializing within create_app or using Flask-Executor for background tasks)
-# For simplicity here, initialize globally. Ensure credentials are set up in the environment (e.g., GOOGLE_APPLICATION_CREDENTIALS).
-try:
-    storage_client = storage.Client()
-    gcs_bucket = storage_client.bucket(GCS_BUCKET_NAME) if GCS_BUCKET_NAME else None
-except Exception as e:
-    print(f"ERROR: Failed to initialize GCS client: {e}")
-    storage_client = None
-    gcs_bucket = None
+# The GCS client is created once in yaml_service (ensure credentials are set up in the environment,
+# e.g. GOOGLE_APPLICATION_CREDENTIALS) and shared here so both modules use one connection pool.
+from ..services.yaml_service import storage_client, gcs_bucket
 # --- End GCS Configuration ---
 
+# Seconds a request waits for a crop before giving up with 504
+CROP_TIMEOUT = float(os.environ.get('CROP_TIMEOUT', 30))
+# Larger raster images are rejected before reaching the crop pool, so a crop stays well inside CROP_TIMEOUT
+CROP_MAX_PIXELS = int(os.environ.get('CROP_MAX_PIXELS', 50_000_000))
+
 # Create a blueprint for YAML routes
 yaml_bp = Blueprint('yaml', __name__, url_prefix='/api/yaml')
 
+# --- Helper Function for JSON Responses ---
+def ojson(obj, status=200):
+    """
+    Build a JSON response with orjson, which encodes large config dicts in C.
+    Non-string keys are stringified, matching Flask's jsonify.
+    """
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), status=status, mimetype='application/json')
+
+def read_json_body():
+    """Decode the JSON request body with orjson. Returns None if the body is not JSON or is malformed."""
+    if not request.is_json:
+        return None
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return None
+
+def collect_module_errors(config):
+    """Returns [{'module', 'error'}] for every module whose resolved config is an error marker."""
+    modules = config.get('modules') if isinstance(config, dict) else None
+    if not isinstance(modules, dict):
+        return []
+    return [
+        {'module': name, 'error': module['config']['error']}
+        for name, module in modules.items()
+        if isinstance(module, dict) and isinstance(module.get('config'), dict) and 'error' in module['config']
+    ]
+
 # --- Helper Function for GCS Upload ---
 def upload_to_gcs(local_file_path, gcs_blob_name):
     """Uploads a file to the GCS bucket."""
@@ -60,76 +101,314 @@ def upload_to_gcs(local_file_path, gcs_blob_name):
     try:
         blob = gcs_bucket.blob(gcs_blob_name)
         blob.upload_from_filename(local_file_path)
-        print(f"File {local_file_path} uploaded to gs://{GCS_BUCKET_NAME}/{gcs_blob_name}.")
+        logger.debug("File %s uploaded to gs://%s/%s.", local_file_path, GCS_BUCKET_NAME, gcs_blob_name)
+        return f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Return the GCS URI
+    except Exception as e:
+        logger.error(f"Failed to upload {local_file_path} to GCS: {e}")
+        raise
+
+def upload_stream_to_gcs(stream, gcs_blob_name, content_type=None):
+    """Uploads a seekable file-like object (e.g. an uploaded file's stream) to the GCS bucket without touching local disk."""
+    if not gcs_bucket:
+        raise ConnectionError("GCS bucket not initialized.")
+    try:
+        blob = gcs_bucket.blob(gcs_blob_name)
+        # A known size lets the client pick a single-request upload without reading ahead
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        blob.upload_from_file(stream, size=size, content_type=content_type)
+        logger.debug("Stream uploaded to gs://%s/%s.", GCS_BUCKET_NAME, gcs_blob_name)
         return f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Return the GCS URI
     except Exception as e:
-        print(f"ERROR: Failed to upload {local_file_path} to GCS: {e}")
+        logger.error(f"Failed to upload stream to {gcs_blob_name}: {e}")
         raise
 
 # --- Helper Function for GCS Cleanup ---
+GCS_BATCH_MAX = 100 # GCS accepts at most 100 calls per batch request
+GCS_UPLOAD_WORKERS = 16 # Concurrent blob uploads per folder upload
+
 def delete_gcs_prefix(prefix):
-    """Deletes all blobs in the GCS bucket with the given prefix."""
+    """Deletes all blobs in the GCS bucket with the given prefix, up to GCS_BATCH_MAX deletes per HTTP request."""
     if not gcs_bucket:
-        print("WARNING: GCS bucket not initialized. Cannot delete prefix.")
+        logger.warning("GCS bucket not initialized. Cannot delete prefix.")
         return
     try:
-        blobs = storage_client.list_blobs(GCS_BUCKET_NAME, prefix=prefix)
-        count = 0
-        for blob in blobs:
-            blob.delete()
-            count += 1
-        print(f"Deleted {count} blobs with prefix '{prefix}' from GCS bucket '{GCS_BUCKET_NAME}'.")
+        # Only names are needed; nextPageToken must be kept for pagination to work
+        blob_names = [blob.name for blob in storage_client.list_blobs(GCS_BUCKET_NAME, prefix=prefix, fields='items(name),nextPageToken')]
+        for start in range(0, len(blob_names), GCS_BATCH_MAX):
+            # raise_exception=False: a blob already gone (NotFound) must not abort the rest of the cleanup
+            with storage_client.batch(raise_exception=False):
+                for name in blob_names[start:start + GCS_BATCH_MAX]:
+                    gcs_bucket.blob(name).delete()
+        logger.debug("Deleted %d blobs with prefix '%s' from GCS bucket '%s'.", len(blob_names), prefix, GCS_BUCKET_NAME)
     except Exception as e:
-        print(f"ERROR: Failed to delete GCS prefix '{prefix}': {e}")
+        logger.error(f"Failed to delete GCS prefix '{prefix}': {e}")
         # Don't raise, just log the error for cleanup
 
-# --- Helper Function for Local Temp Directory Cleanup ---
-def cleanup_temp_directory():
+# --- Upload Size Limits ---
+# Checked before anything reaches GCS or the parser; oversized inputs (including zip bombs) get 413
+MAX_YAML_BYTES = int(os.environ.get('MAX_YAML_BYTES', 10 * 1024 * 1024)) # Any single file
+MAX_ZIP_BYTES = int(os.environ.get('MAX_ZIP_BYTES', 50 * 1024 * 1024)) # Total uncompressed size of an archive
+MAX_ZIP_MEMBERS = int(os.environ.get('MAX_ZIP_MEMBERS', 500))
+# Multipart zip uploads up to this size are read into memory; larger ones are saved to a temp file once
+IN_MEMORY_ZIP_LIMIT = int(os.environ.get('IN_MEMORY_ZIP_LIMIT', 16 * 1024 * 1024))
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds one of the size limits above."""
+
+def check_zip_limits(infos):
+    """Raises UploadTooLargeError if the archive's entries (ZipInfo-like) exceed the member or size limits."""
+    if len(infos) > MAX_ZIP_MEMBERS:
+        raise UploadTooLargeError(f'Zip has {len(infos)} entries (limit is {MAX_ZIP_MEMBERS})')
+    total_size = 0
+    for info in infos:
+        if info.file_size > MAX_YAML_BYTES:
+            raise UploadTooLargeError(f'{info.filename} is {info.file_size} bytes (limit is {MAX_YAML_BYTES} per file)')
+        total_size += info.file_size
+    if total_size > MAX_ZIP_BYTES:
+        raise UploadTooLargeError(f'Zip expands to {total_size} bytes (limit is {MAX_ZIP_BYTES})')
+
+# --- Helper Functions for Zip Validation and Upload ---
+def is_safe_zip_member(name):
+    """Returns False for zip member names that are absolute or would escape the extraction directory."""
+    normalized = posixpath.normpath(name.replace('\\', '/'))
+    return not (normalized.startswith('/') or normalized == '..' or normalized.startswith('../'))
+
+def upload_zip_members_to_gcs(zip_ref, members, gcs_prefix, open_zip=None):
+    """
+    Upload zip members straight to GCS under gcs_prefix, without extracting them to local disk.
+    One ZipFile is not thread-safe, so by default members are read on the calling thread and uploaded
+    concurrently. If open_zip is given (a callable returning a new ZipFile over the same archive), each
+    worker inflates through its own handle instead, so decompression also runs in parallel (zlib releases the GIL).
+
+    Returns:
+        Dict mapping each member name to its bytes.
+    """
+    def upload_member(member, data):
+        blob = gcs_bucket.blob(f"{gcs_prefix}{member}")
+        blob.upload_from_file(io.BytesIO(data), size=len(data))
+
+    worker_state = threading.local()
+    worker_handles = []
+
+    def read_and_upload_member(member):
+        handle = getattr(worker_state, 'zip_ref', None)
+        if handle is None:
+            handle = worker_state.zip_ref = open_zip()
+            worker_handles.append(handle) # list.append is atomic
+        data = handle.read(member)
+        upload_member(member, data)
+        return data
+
+    contents = {}
+    try:
+        with ThreadPoolExecutor(max_workers=GCS_UPLOAD_WORKERS) as executor:
+            if open_zip is not None:
+                futures = {member: executor.submit(read_and_upload_member, member) for member in members}
+                for member, future in futures.items():
+                    contents[member] = future.result() # Re-raise the first failure
+            else:
+                futures = []
+                for member in members:
+                    contents[member] = zip_ref.read(member)
+                    futures.append(executor.submit(upload_member, member, contents[member]))
+                for future in futures:
+                    future.result() # Re-raise the first upload failure
+    finally:
+        for handle in worker_handles:
+            handle.close()
+    logger.debug("Uploaded %d zip member(s) to GCS prefix: %s", len(members), gcs_prefix)
+    return contents
+
+# --- Helper Function for Streaming Zip Extraction ---
+ZIP_STREAM_CHUNK_SIZE = 65536
+
+def extract_zip_stream(chunks, dest_dir):
+    """
+    Extract a zip archive from an iterable of byte chunks, writing each member as it arrives.
+    Directory entries and members that would land outside dest_dir are skipped.
+    Raises UploadTooLargeError as soon as the archive exceeds the member or size limits.
+    """
+    dest_root = os.path.realpath(dest_dir)
+    member_count = 0
+    total_size = 0
+    for file_name, _, unzipped_chunks in stream_unzip(chunks):
+        member_count += 1
+        if member_count > MAX_ZIP_MEMBERS:
+            raise UploadTooLargeError(f'Zip has more than {MAX_ZIP_MEMBERS} entries')
+        name = file_name.decode('utf-8')
+        target_path = os.path.realpath(os.path.join(dest_root, name))
+        if name.endswith('/') or not target_path.startswith(dest_root + os.sep):
+            # A member must be fully consumed before the next one can be read
+            for _ in unzipped_chunks:
+                pass
+            continue
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        member_size = 0
+        with open(target_path, 'wb') as f:
+            for chunk in unzipped_chunks:
+                # Sizes in a streamed zip's headers may be absent or forged, so count what is actually inflated
+                member_size += len(chunk)
+                total_size += len(chunk)
+                if member_size > MAX_YAML_BYTES:
+                    raise UploadTooLargeError(f'{name} exceeds {MAX_YAML_BYTES} bytes')
+                if total_size > MAX_ZIP_BYTES:
+                    raise UploadTooLargeError(f'Zip expands to more than {MAX_ZIP_BYTES} bytes')
+                f.write(chunk)
+
+# --- Helper Functions for Processing an Uploaded Folder ---
+def walk_files(root, relative_dir=''):
+    """
+    Yield (path, posix path relative to root) for every regular file under root.
+    DirEntry carries the file type from readdir, so no per-entry stat() is needed; symlinks are not followed.
+    """
+    with os.scandir(os.path.join(root, relative_dir)) as entries:
+        for entry in entries:
+            relative_path = posixpath.join(relative_dir, entry.name) if relative_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(root, relative_path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path, relative_path
+
+def upload_directory_to_gcs(local_dir, gcs_prefix):
+    """Upload every file under local_dir to GCS under gcs_prefix, keeping relative paths."""
+    logger.debug("Uploading extracted files to GCS prefix: %s", gcs_prefix)
+    # Relative paths are joined with posixpath, so GCS names stay forward-slashed on every platform
+    upload_pairs = [(path, f"{gcs_prefix}{relative_path}") for path, relative_path in walk_files(local_dir)]
+    # Each upload is a blocking HTTPS request, so overlap them; list() re-raises the first failure
+    with ThreadPoolExecutor(max_workers=GCS_UPLOAD_WORKERS) as executor:
+        list(executor.map(lambda pair: upload_to_gcs(*pair), upload_pairs))
+
+def process_folder_config(main_file_relative, upload_id):
+    """
+    Process the main YAML file of a folder already uploaded to GCS under the upload prefix.
+    Needs no request or app context, so it can also run as a background job.
+
+    Returns:
+        Tuple of (response body dict, HTTP status code).
     """
-    Cleans up the local temporary directory by removing all files in it.
+    gcs_prefix = f"uploads/{upload_id}/"
+
+    logger.debug("Processing main YAML file via GCS context: %s", main_file_relative)
+    # Process the main YAML file using the upload_id and its relative path
+    # process_yaml_file needs adaptation for GCS
+    config = process_yaml_file(upload_id=upload_id, relative_path=main_file_relative)
+
+    # Check for embedded errors
+    processing_errors = collect_module_errors(config)
+    if processing_errors:
+        logger.warning(f"Found errors during processing: {processing_errors}")
+        # Clean up GCS on error
+        delete_gcs_prefix(gcs_prefix)
+        return {'error': 'Errors occurred during YAML processing.', 'details': processing_errors}, 422
+
+    return {'config': config, 'uploadId': upload_id}, 200
+
+def process_uploaded_folder(main_file_relative, upload_id):
+    """
+    Process an uploaded folder and build the route response.
+    Shared by the multipart and streaming folder upload routes; callers handle cleanup on exceptions.
+
+    Returns:
+        Flask response with the processed config and the uploadId, or an error response.
+    """
+    body, status = process_folder_config(main_file_relative, upload_id)
+    if status != 200:
+        return ojson(body, status)
+
+    # Return config and the upload ID (CORS headers are added app-wide by Flask-CORS)
+    return ojson(body)
+
+# --- Background Upload Jobs ---
+# Folder uploads sent with ?async=1 get a 202 and are processed on the app's worker pool.
+# Job state lives in this process; the service runs a single gunicorn worker (see Dockerfile).
+JOB_HISTORY_MAX = 256
+_jobs = OrderedDict() # job_id -> Future resolving to (body, status)
+_jobs_lock = threading.Lock()
+
+def run_folder_job(main_file_relative, upload_id):
+    """Background body of an async folder upload; removes the GCS upload prefix if processing raises."""
+    try:
+        return process_folder_config(main_file_relative, upload_id)
+    except Exception:
+        logger.error(f"Background processing failed for upload {upload_id}:\n{traceback.format_exc()}")
+        delete_gcs_prefix(f"uploads/{upload_id}/")
+        raise
+
+def submit_folder_job(main_file_relative, upload_id):
+    """Queue processing of an uploaded folder and return its job ID, forgetting the oldest jobs past JOB_HISTORY_MAX."""
+    job_id = str(uuid.uuid4())
+    future = current_app.yaml_pool.submit(run_folder_job, main_file_relative, upload_id)
+    with _jobs_lock:
+        _jobs[job_id] = future
+        while len(_jobs) > JOB_HISTORY_MAX:
+            _jobs.popitem(last=False)
+    return job_id
+
+# --- Helper Functions for Local Temp Directory Cleanup ---
+# Entries younger than this may still belong to an in-flight request and are left alone
+TEMP_FILE_TTL = int(os.environ.get('TEMP_FILE_TTL', 15 * 60))
+# How often the background sweeper started by create_app runs
+TEMP_SWEEP_INTERVAL = int(os.environ.get('TEMP_SWEEP_INTERVAL', 15 * 60))
+
+def cleanup_temp_directory(max_age_seconds=TEMP_FILE_TTL):
+    """
+    Cleans up the local temporary directory by removing files and subdirectories older than max_age_seconds.
     This function is designed to be safe and not raise exceptions.
     """
     try:
         # In Cloud Run, we should use a directory that's definitely writable
         # /tmp is generally available in most container environments
         if os.path.exists(TEMP_UPLOAD_DIR):
-            print(f"Attempting to clean up temporary directory: {TEMP_UPLOAD_DIR}")
-            try:
-                # Check if we have write permissions by creating a test file
-                test_file = os.path.join(TEMP_UPLOAD_DIR, '.test_write_permission')
-                with open(test_file, 'w') as f:
-                    f.write('test')
-                os.remove(test_file)
-                
-                # If we get here, we have write permissions
-                # Remove all files and subdirectories in the temp directory
-                for item in os.listdir(TEMP_UPLOAD_DIR):
-                    item_path = os.path.join(TEMP_UPLOAD_DIR, item)
+            logger.debug("Sweeping stale entries from temporary directory: %s", TEMP_UPLOAD_DIR)
+            cutoff = time.time() - max_age_seconds
+            removed = 0
+            with os.scandir(TEMP_UPLOAD_DIR) as entries:
+                for entry in entries:
                     try:
-                        if os.path.isfile(item_path):
-                            os.unlink(item_path)
-                        elif os.path.isdir(item_path):
-                            shutil.rmtree(item_path)
+                        if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            shutil.rmtree(entry.path)
+                        else:
+                            os.unlink(entry.path)
+                        removed += 1
                     except Exception as item_error:
-                        print(f"WARNING: Could not remove {item_path}: {item_error}")
+                        logger.warning(f"Could not remove {entry.path}: {item_error}")
                         # Continue with other files even if one fails
                         continue
-                print(f"Successfully cleaned up temporary directory: {TEMP_UPLOAD_DIR}")
-            except Exception as perm_error:
-                print(f"WARNING: No write permission for {TEMP_UPLOAD_DIR}: {perm_error}")
-                # Don't try to create or clean if we don't have permissions
+            logger.debug("Removed %d stale entries from %s", removed, TEMP_UPLOAD_DIR)
         else:
             # Create the directory if it doesn't exist
             try:
                 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
-                print(f"Created temporary directory: {TEMP_UPLOAD_DIR}")
+                logger.debug("Created temporary directory: %s", TEMP_UPLOAD_DIR)
             except Exception as mkdir_error:
-                print(f"WARNING: Could not create directory {TEMP_UPLOAD_DIR}: {mkdir_error}")
-                # If we can't create the directory, we'll use tempfile.mkdtemp() later
+                logger.warning(f"Could not create directory {TEMP_UPLOAD_DIR}: {mkdir_error}")
     except Exception as e:
-        print(f"WARNING: Failed to clean up temporary directory {TEMP_UPLOAD_DIR}: {e}")
+        logger.warning(f"Failed to clean up temporary directory {TEMP_UPLOAD_DIR}: {e}")
         # Don't raise, just log the warning
 
+    # Sweep stale JSON sidecars left behind by /fetch
+    try:
+        cleanup_local_sidecars()
+    except Exception as e:
+        logger.warning(f"Failed to clean up local sidecars: {e}")
+
+def start_temp_sweeper(interval_seconds=TEMP_SWEEP_INTERVAL):
+    """
+    Runs cleanup_temp_directory every interval_seconds on a daemon thread, keeping housekeeping
+    off the request path. Returns the threading.Event that stops the sweeper when set.
+    """
+    stop_event = threading.Event()
+
+    def sweep():
+        while not stop_event.wait(interval_seconds):
+            cleanup_temp_directory()
+
+    threading.Thread(target=sweep, name='temp-sweeper', daemon=True).start()
+    return stop_event
+
 # --- Modified Routes ---
 
 # Renamed from /cleanup-temp
@@ -140,41 +419,64 @@ def cleanup_upload():
     Request body:
         uploadId: The unique ID for the upload session.
     """
-    data = request.json
+    data = read_json_body() or {}
     upload_id = data.get('uploadId')
 
     if not upload_id:
-        return jsonify({'error': 'No uploadId provided'}), 400
+        return ojson({'error': 'No uploadId provided'}, 400)
 
     if not gcs_bucket:
-         return jsonify({'error': 'GCS not configured on server'}), 500
+         return ojson({'error': 'GCS not configured on server'}, 500)
+
+    if is_preset_upload_id(upload_id):
+        # Preset sessions read presets/ in place; there is nothing of theirs to delete
+        return ojson({'message': f'Upload context {upload_id} cleaned up successfully'}, 200)
 
     gcs_prefix = f"uploads/{upload_id}/"
     try:
+        invalidate_upload_cache(upload_id)
         delete_gcs_prefix(gcs_prefix)
-        return jsonify({'message': f'Upload context {upload_id} cleaned up successfully'}), 200
+        return ojson({'message': f'Upload context {upload_id} cleaned up successfully'}, 200)
     except Exception as e:
         error_message = f"Error cleaning up GCS upload context {upload_id}: {str(e)}"
-        print(error_message)
-        return jsonify({'error': error_message}), 500
+        logger.error(error_message)
+        return ojson({'error': error_message}, 500)
+
+# Content types under which /parse accepts a raw YAML body
+YAML_MIMETYPES = frozenset({'application/yaml', 'application/x-yaml', 'text/yaml', 'text/x-yaml'})
 
 @yaml_bp.route('/parse', methods=['POST'])
 def parse():
     """
     Parse YAML content provided in the request body. (No GCS interaction needed here)
+    The body is either JSON ({"content": "<yaml>"}) or the raw YAML itself, sent with a YAML content type.
     """
-    data = request.json
-    if not data or 'content' not in data:
-        return jsonify({'error': 'No content provided'}), 400
+    # Check the declared size before the body is read and decoded
+    max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_length and request.content_length and request.content_length > max_length:
+        return ojson({'error': f'Request body too large (limit is {max_length} bytes)'}, 413)
+    if request.mimetype in YAML_MIMETYPES:
+        # Raw YAML goes to the parser as bytes, without a JSON envelope or a text decode
+        content = request.get_data()
+        if not content:
+            return ojson({'error': 'No content provided'}, 400)
+    else:
+        data = read_json_body()
+        if not data or 'content' not in data:
+            return ojson({'error': 'No content provided'}, 400)
+        content = data['content']
+    if isinstance(content, (str, bytes)) and not content.strip():
+        # Empty documents parse to an empty config; skip the parser entirely
+        return ojson({})
     try:
         # Parse the YAML content directly (no GCS context)
-        # Assuming parse_yaml_content doesn't need GCS for direct parsing
-        config = parse_yaml_content(data['content'])
-        return jsonify(config)
+        # Identical resubmissions are served from the content-hash cache
+        config = parse_yaml_content_cached(content)
+        return ojson(config)
     except Exception as e:
         error_message = f"Error parsing YAML content: {str(e)}"
-        print(error_message)
-        return jsonify({'error': error_message}), 500
+        logger.error(error_message)
+        return ojson({'error': error_message}, 500)
 
 # /check-references might be less useful now, as references are resolved dynamically from GCS.
 # Keeping it for now, but it only checks the main file locally.
@@ -185,35 +487,27 @@ def check_references():
     NOTE: This does not check references within the GCS context.
     """
     if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+        return ojson({'error': 'No file provided'}, 400)
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return ojson({'error': 'No file selected'}, 400)
 
-    local_temp_dir = None
-    file_path = None
     try:
-        local_temp_dir = tempfile.mkdtemp()
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(local_temp_dir, filename)
-        file.save(file_path)
-        print(f"Checking references in temporary local file: {file_path}")
-        # find_all_config_references needs adaptation for GCS if it's to be fully functional
-        # For now, it only checks the main file locally.
-        references = find_all_config_references(file_path) # This likely needs GCS context
-        if file_path in references:
-            references.remove(file_path)
-        return jsonify({'references': references, 'count': len(references)})
+        # Scan the upload straight from its stream; only the main file is available locally anyway,
+        # so relative references resolve exactly as they did against an empty temp dir.
+        logger.debug("Checking references in uploaded file: %s", file.filename)
+        content = file.stream.read().decode('utf-8')
+        try:
+            references = find_all_config_references_in_content(content)
+        except yaml.YAMLError as parse_error:
+            # Unparseable files simply have no detectable references
+            logger.error(f"Error parsing uploaded file {file.filename}: {parse_error}")
+            references = []
+        return ojson({'references': references, 'count': len(references)})
     except Exception as e:
         error_message = f"Error checking references in YAML file: {str(e)}"
-        print(error_message)
-        return jsonify({'error': error_message}), 500
-    finally:
-        if local_temp_dir and os.path.exists(local_temp_dir):
-            try:
-                shutil.rmtree(local_temp_dir)
-            except Exception as cleanup_error:
-                 print(f"Error cleaning up local temp dir {local_temp_dir}: {cleanup_error}")
+        logger.error(error_message)
+        return ojson({'error': error_message}, 500)
 
 # Removed copy_referenced_files function as it's GCS specific now and handled differently
 
@@ -228,37 +522,29 @@ def upload():
     Returns:
         JSON object containing the processed config and the uploadId.
     """
-    # Try to clean up the temporary directory before processing a new upload
-    # But don't fail if cleanup fails
-    try:
-        cleanup_temp_directory()
-    except Exception as e:
-        print(f"WARNING: Temp directory cleanup failed but continuing: {e}")
-    
+    # Nothing is written locally on this path, so no temp directory cleanup is needed
     if not gcs_bucket:
-         return jsonify({'error': 'GCS not configured on server'}), 500
+         return ojson({'error': 'GCS not configured on server'}, 500)
     if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+        return ojson({'error': 'No file provided'}, 400)
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return ojson({'error': 'No file selected'}, 400)
+
+    file_size = file.stream.seek(0, os.SEEK_END)
+    file.stream.seek(0)
+    if file_size > MAX_YAML_BYTES:
+        return ojson({'error': f'File too large ({file_size} bytes, limit is {MAX_YAML_BYTES})'}, 413)
 
     upload_id = str(uuid.uuid4())
     gcs_prefix = f"uploads/{upload_id}/"
     original_filename = secure_filename(file.filename)
     gcs_blob_name = f"{gcs_prefix}{original_filename}"
 
-    local_temp_dir = None
-    local_file_path = None
     try:
-        # Save locally temporarily to upload to GCS
-        local_temp_dir = tempfile.mkdtemp()
-        local_file_path = os.path.join(local_temp_dir, original_filename)
-        file.save(local_file_path)
-
-        # Upload the main file to GCS
-        gcs_uri = upload_to_gcs(local_file_path, gcs_blob_name)
-        print(f"Uploaded main file to: {gcs_uri}")
+        # Upload the main file to GCS straight from the request stream
+        gcs_uri = upload_stream_to_gcs(file.stream, gcs_blob_name, content_type='application/x-yaml')
+        logger.debug("Uploaded main file to: %s", gcs_uri)
 
         # Process the YAML file using its GCS path/upload_id
         # process_yaml_file needs to be adapted for GCS
@@ -266,71 +552,142 @@ def upload():
         config = process_yaml_file(upload_id=upload_id, relative_path=original_filename)
 
         # Check for embedded errors (assuming process_yaml_file returns them similarly)
-        processing_errors = []
-        if isinstance(config, dict) and 'modules' in config:
-            for module_name, module_data in config['modules'].items():
-                 if isinstance(module_data, dict) and isinstance(module_data.get('config'), dict) and 'error' in module_data['config']:
-                      processing_errors.append({
-                          'module': module_name,
-                          'error': module_data['config']['error']
-                      })
+        processing_errors = collect_module_errors(config)
         if processing_errors:
-            print(f"Found errors during processing: {processing_errors}")
+            logger.warning(f"Found errors during processing: {processing_errors}")
             # Clean up GCS on error
             delete_gcs_prefix(gcs_prefix)
-            return jsonify({'error': 'Errors occurred during YAML processing.', 'details': processing_errors}), 422
+            return ojson({'error': 'Errors occurred during YAML processing.', 'details': processing_errors}, 422)
 
-        # Return config and the upload ID with CORS header
-        response = make_response(jsonify({'config': config, 'uploadId': upload_id}))
-        response.headers['Access-Control-Allow-Origin'] = 'https://network-visualizer-36300.web.app' # Or '*' for testing, but specific is better
-        return response
+        # Return config and the upload ID
+        return ojson({'config': config, 'uploadId': upload_id})
 
     except Exception as e:
         error_message = f"Error processing single YAML upload: {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"{error_message}\nTraceback:\n{tb_str}")
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
         # Clean up GCS on error
         delete_gcs_prefix(gcs_prefix)
-        return jsonify({'error': error_message}), 500
-    finally:
-        # Clean up local temporary directory
-        if local_temp_dir and os.path.exists(local_temp_dir):
-            try:
-                shutil.rmtree(local_temp_dir)
-            except Exception as cleanup_error:
-                print(f"Error cleaning up local temp dir {local_temp_dir}: {cleanup_error}")
+        return ojson({'error': error_message}, 500)
 
 
 @yaml_bp.route('/upload-folder', methods=['POST'])
 def upload_folder():
     """
-    Upload a folder (zip), extract locally, upload contents to GCS, process main file.
+    Upload a folder (zip), upload the main file and its references to GCS, process main file.
 
     Request body:
         zip_file: Zip file containing YAML files
         main_file: Path to the main YAML file within the zip file
 
+        async: (Optional query parameter) "1" to return 202 with a jobId instead of waiting for processing;
+            poll /job-status/<jobId> for the result.
+
     Returns:
         JSON object containing the processed config and the uploadId.
     """
-    # Try to clean up the temporary directory before processing a new upload
-    # But don't fail if cleanup fails
-    try:
-        cleanup_temp_directory()
-    except Exception as e:
-        print(f"WARNING: Temp directory cleanup failed but continuing: {e}")
-    
     if not gcs_bucket:
-         return jsonify({'error': 'GCS not configured on server'}), 500
+         return ojson({'error': 'GCS not configured on server'}, 500)
     if 'zip_file' not in request.files:
-        return jsonify({'error': 'No zip file provided'}), 400
+        return ojson({'error': 'No zip file provided'}, 400)
     zip_file_storage = request.files['zip_file']
     if zip_file_storage.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return ojson({'error': 'No file selected'}, 400)
 
     main_file_relative = request.form.get('main_file', '')
     if not main_file_relative:
-        return jsonify({'error': 'No main file specified'}), 400
+        return ojson({'error': 'No main file specified'}, 400)
+
+    upload_id = str(uuid.uuid4())
+    gcs_prefix = f"uploads/{upload_id}/"
+    zip_path = None
+
+    try:
+        # Werkzeug spools uploads over 500 KB to an anonymous temp file; ZipFile seeks to every member header,
+        # so keep archives up to IN_MEMORY_ZIP_LIMIT in RAM and save larger ones to a named file once
+        zip_size = zip_file_storage.stream.seek(0, os.SEEK_END)
+        zip_file_storage.stream.seek(0)
+        if zip_size <= IN_MEMORY_ZIP_LIMIT:
+            zip_bytes = zip_file_storage.stream.read()
+            zip_source = io.BytesIO(zip_bytes)
+            # Each upload worker opens its own handle over the shared bytes (BytesIO does not copy them)
+            open_zip = lambda: zipfile.ZipFile(io.BytesIO(zip_bytes))
+        else:
+            # Kept under TEMP_UPLOAD_DIR so the sweeper reclaims it if this process dies mid-request
+            fd, zip_path = tempfile.mkstemp(suffix='.zip', dir=TEMP_UPLOAD_DIR)
+            with os.fdopen(fd, 'wb') as zip_out:
+                shutil.copyfileobj(zip_file_storage.stream, zip_out, 1024 * 1024)
+            zip_source = zip_path
+            open_zip = lambda: zipfile.ZipFile(zip_path)
+        with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+            # Reject oversized archives and path traversal before anything is uploaded
+            try:
+                check_zip_limits(zip_ref.infolist())
+            except UploadTooLargeError as e:
+                return ojson({'error': str(e)}, 413)
+            unsafe_members = [name for name in zip_ref.namelist() if not is_safe_zip_member(name)]
+            if unsafe_members:
+                return ojson({'error': 'Zip contains unsafe paths.', 'details': unsafe_members}, 400)
+            main_member = posixpath.normpath(main_file_relative)
+            if main_member not in zip_ref.namelist():
+                return ojson({'error': f'Main file not found in zip: {main_file_relative}'}, 400)
+            # Only the main file and the YAML files it (transitively) references are needed
+            needed_members = find_zip_config_references(zip_ref, main_member)
+            # Pipe the needed members straight from the archive into GCS; nothing touches local disk
+            contents = upload_zip_members_to_gcs(zip_ref, needed_members, gcs_prefix, open_zip=open_zip)
+        # Every needed member is YAML we already hold, so reference resolution can skip re-downloading them
+        primed_texts = {}
+        for member, data in contents.items():
+            try:
+                primed_texts[member] = data.decode('utf-8')
+            except UnicodeDecodeError:
+                pass # Left to the regular download path, which reports it
+        prime_upload_texts(upload_id, primed_texts)
+
+        if request.args.get('async') in ('1', 'true'):
+            # The members are already in GCS, so only the YAML processing is deferred
+            job_id = submit_folder_job(main_file_relative, upload_id)
+            return ojson({'uploadId': upload_id, 'jobId': job_id}, 202)
+        return process_uploaded_folder(main_file_relative, upload_id)
+
+    except Exception as e:
+        error_message = f"Error processing YAML folder upload: {str(e)}"
+        tb_str = traceback.format_exc()
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
+        # Clean up GCS on error
+        delete_gcs_prefix(gcs_prefix)
+        return ojson({'error': error_message}, 500)
+    finally:
+        if zip_path:
+            try:
+                os.unlink(zip_path)
+            except OSError as e:
+                logger.warning(f"Could not remove spooled zip {zip_path}: {e}")
+
+
+@yaml_bp.route('/upload-folder-stream', methods=['POST'])
+def upload_folder_stream():
+    """
+    Upload a folder as a raw zip request body, extracting it while it streams in.
+    Avoids Werkzeug spooling the whole multipart upload before extraction can start.
+
+    Request:
+        body: Zip file bytes (Content-Type: application/zip)
+        main_file: Query parameter with the path to the main YAML file within the zip file
+
+    Returns:
+        JSON object containing the processed config and the uploadId.
+    """
+    if not gcs_bucket:
+         return ojson({'error': 'GCS not configured on server'}, 500)
+    if request.mimetype != 'application/zip':
+        return ojson({'error': 'Request body must be a zip file (Content-Type: application/zip)'}, 415)
+
+    main_file_relative = request.args.get('main_file', '')
+    if not main_file_relative:
+        return ojson({'error': 'No main file specified'}, 400)
+    if not is_safe_zip_member(main_file_relative):
+        return ojson({'error': f'Invalid main file path: {main_file_relative}'}, 400)
 
     upload_id = str(uuid.uuid4())
     gcs_prefix = f"uploads/{upload_id}/"
@@ -338,67 +695,72 @@ def upload_folder():
 
     try:
         # Create a temporary directory for local extraction
-        local_extract_dir = tempfile.mkdtemp()
-        print(f"Extracting zip file locally to: {local_extract_dir}")
+        # Kept under TEMP_UPLOAD_DIR so the sweeper reclaims it if this process dies mid-request
+        local_extract_dir = tempfile.mkdtemp(dir=TEMP_UPLOAD_DIR)
+        logger.debug("Extracting streamed zip locally to: %s", local_extract_dir)
 
-        # Extract the zip file locally
-        with zipfile.ZipFile(zip_file_storage, 'r') as zip_ref:
-            zip_ref.extractall(local_extract_dir)
+        # Extract members as the body arrives, overlapping network and disk I/O
+        extract_zip_stream(iter(lambda: request.stream.read(ZIP_STREAM_CHUNK_SIZE), b''), local_extract_dir)
 
         # Check if main file exists locally after extraction
-        local_main_file_path = os.path.join(local_extract_dir, main_file_relative)
-        if not os.path.exists(local_main_file_path):
-            return jsonify({'error': f'Main file not found in zip: {main_file_relative}'}), 400
-
-        # Upload all extracted files to GCS under the upload_id prefix
-        print(f"Uploading extracted files to GCS prefix: {gcs_prefix}")
-        for root, _, files in os.walk(local_extract_dir):
-            for filename in files:
-                local_path = os.path.join(root, filename)
-                # Calculate relative path within the extracted structure
-                relative_path = os.path.relpath(local_path, local_extract_dir)
-                gcs_blob_name = f"{gcs_prefix}{relative_path}"
-                upload_to_gcs(local_path, gcs_blob_name)
-
-        print(f"Processing main YAML file via GCS context: {main_file_relative}")
-        # Process the main YAML file using the upload_id and its relative path
-        # process_yaml_file needs adaptation for GCS
-        config = process_yaml_file(upload_id=upload_id, relative_path=main_file_relative)
+        if not os.path.exists(os.path.join(local_extract_dir, main_file_relative)):
+            return ojson({'error': f'Main file not found in zip: {main_file_relative}'}, 400)
 
-        # Check for embedded errors
-        processing_errors = []
-        if isinstance(config, dict) and 'modules' in config:
-             for module_name, module_data in config['modules'].items():
-                  if isinstance(module_data, dict) and isinstance(module_data.get('config'), dict) and 'error' in module_data['config']:
-                       processing_errors.append({
-                           'module': module_name,
-                           'error': module_data['config']['error']
-                       })
-        if processing_errors:
-            print(f"Found errors during processing: {processing_errors}")
-            # Clean up GCS on error
-            delete_gcs_prefix(gcs_prefix)
-            return jsonify({'error': 'Errors occurred during YAML processing.', 'details': processing_errors}), 422
-
-        # Return config and the upload ID with CORS header
-        response = make_response(jsonify({'config': config, 'uploadId': upload_id}))
-        response.headers['Access-Control-Allow-Origin'] = 'https://network-visualizer-36300.web.app' # Or '*' for testing, but specific is better
-        return response
+        upload_directory_to_gcs(local_extract_dir, gcs_prefix)
+        # The reference closure is still on local disk; hand its text over so resolution skips the GCS round trips.
+        # References are followed on the local filesystem, so only files inside the extraction directory are read
+        main_file_path = os.path.join(local_extract_dir, main_file_relative)
+        extract_root = os.path.join(os.path.realpath(local_extract_dir), '')
+        referenced_texts = {}
+        for path in find_all_config_references(main_file_path):
+            real_path = os.path.realpath(path)
+            if not real_path.startswith(extract_root):
+                logger.warning("Skipping reference outside the uploaded folder: %s", path)
+                continue
+            with open(real_path, 'r', encoding='utf-8') as f:
+                referenced_texts[os.path.relpath(real_path, extract_root)] = f.read()
+        prime_upload_texts(upload_id, referenced_texts)
+        return process_uploaded_folder(main_file_relative, upload_id)
 
+    except UploadTooLargeError as e:
+        delete_gcs_prefix(gcs_prefix)
+        return ojson({'error': str(e)}, 413)
     except Exception as e:
-        error_message = f"Error processing YAML folder upload: {str(e)}"
+        error_message = f"Error processing streamed YAML folder upload: {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"{error_message}\nTraceback:\n{tb_str}")
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
         # Clean up GCS on error
         delete_gcs_prefix(gcs_prefix)
-        return jsonify({'error': error_message}), 500
+        return ojson({'error': error_message}, 500)
     finally:
         # Clean up local extraction directory
         if local_extract_dir and os.path.exists(local_extract_dir):
             try:
                 shutil.rmtree(local_extract_dir)
             except Exception as cleanup_error:
-                print(f"Error cleaning up local extract dir {local_extract_dir}: {cleanup_error}")
+                logger.error(f"Error cleaning up local extract dir {local_extract_dir}: {cleanup_error}")
+
+
+@yaml_bp.route('/job-status/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Report the state of an async folder upload.
+
+    Returns:
+        JSON object with 'state' (PENDING, RUNNING, SUCCESS or FAILURE). On SUCCESS it also carries
+        'status' and 'result', the status code and body the synchronous upload would have returned.
+    """
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return ojson({'error': f'Unknown job: {job_id}'}, 404)
+    if not future.done():
+        return ojson({'state': 'RUNNING' if future.running() else 'PENDING'})
+    error = future.exception()
+    if error is not None:
+        return ojson({'state': 'FAILURE', 'error': f"Error processing YAML folder upload: {error}"})
+    body, status = future.result()
+    return ojson({'state': 'SUCCESS', 'status': status, 'result': body})
 
 
 @yaml_bp.route('/get-subgraph', methods=['POST'])
@@ -412,64 +774,56 @@ def get_subgraph():
         moduleName: (Optional) Name of the module requesting the subgraph.
     """
     if not gcs_bucket:
-         return jsonify({'error': 'GCS not configured on server'}), 500
+         return ojson({'error': 'GCS not configured on server'}, 500)
 
-    data = request.json
+    data = read_json_body() or {}
     upload_id = data.get('uploadId')
     relative_path = data.get('relativePath') # e.g., "block.yaml" or "inception/block.yaml"
     module_name = data.get('moduleName', 'ComposableModel') # Used for error reporting
 
     if not upload_id:
-        return jsonify({'error': 'No uploadId provided'}), 400
+        return ojson({'error': 'No uploadId provided'}, 400)
     if not relative_path:
-        return jsonify({'error': 'No relativePath provided'}), 400
+        return ojson({'error': 'No relativePath provided'}, 400)
 
     try:
-        print(f"Processing subgraph request for uploadId: {upload_id}, path: {relative_path}")
+        logger.debug("Processing subgraph request for uploadId: %s, path: %s", upload_id, relative_path)
 
         # Process the YAML file using the upload_id and relative path
         # process_yaml_file needs adaptation for GCS
         config = process_yaml_file(upload_id=upload_id, relative_path=relative_path)
 
         # Check for embedded errors (including file not found within GCS context)
-        processing_errors = []
-        if isinstance(config, dict):
-            if config.get('errorType') == 'CONFIG_FILE_NOT_FOUND_GCS':
-                 # Specific error from GCS processing
-                 return jsonify({
-                     'error': config.get('error', f'Subgraph file not found in GCS: {relative_path}'),
-                     'errorType': 'CONFIG_FILE_NOT_FOUND', # Keep consistent for frontend
-                     'configPath': relative_path,
-                     'moduleName': module_name
-                 }), 404
-            elif 'modules' in config:
-                 # Check for errors within modules after processing
-                 for mod_name, module_data in config['modules'].items():
-                      if isinstance(module_data, dict) and isinstance(module_data.get('config'), dict) and 'error' in module_data['config']:
-                           processing_errors.append({
-                               'module': mod_name,
-                               'error': module_data['config']['error']
-                           })
+        if isinstance(config, dict) and config.get('errorType') == 'CONFIG_FILE_NOT_FOUND_GCS':
+             # Specific error from GCS processing
+             return ojson({
+                 'error': config.get('error', f'Subgraph file not found in GCS: {relative_path}'),
+                 'errorType': 'CONFIG_FILE_NOT_FOUND', # Keep consistent for frontend
+                 'configPath': relative_path,
+                 'moduleName': module_name
+             }, 404)
+        # Check for errors within modules after processing
+        processing_errors = collect_module_errors(config)
 
         if processing_errors:
-             print(f"Found errors during subgraph processing: {processing_errors}")
-             return jsonify({'error': 'Errors occurred during subgraph YAML processing.', 'details': processing_errors}), 422
+             logger.warning(f"Found errors during subgraph processing: {processing_errors}")
+             return ojson({'error': 'Errors occurred during subgraph YAML processing.', 'details': processing_errors}, 422)
 
-        return jsonify(config) # Return 200 OK
+        return ojson(config) # Return 200 OK
 
     except FileNotFoundError: # Catch specific error if process_yaml_file raises it for GCS not found
-         print(f"Error: File not found in GCS for uploadId: {upload_id}, path: {relative_path}")
-         return jsonify({
+         logger.error(f"Error: File not found in GCS for uploadId: {upload_id}, path: {relative_path}")
+         return ojson({
              'error': f'Subgraph file not found: {relative_path}',
              'errorType': 'CONFIG_FILE_NOT_FOUND',
              'configPath': relative_path,
              'moduleName': module_name
-         }), 404
+         }, 404)
     except Exception as e:
         error_message = f"Error processing subgraph file '{relative_path}' for upload {upload_id}: {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"{error_message}\nTraceback:\n{tb_str}")
-        return jsonify({'error': error_message}), 500
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
+        return ojson({'error': error_message}, 500)
 
 
 # /fetch remains for external URLs, no GCS context needed
@@ -478,21 +832,21 @@ def fetch():
     """
     Fetch a YAML file from a URL and process it.
     """
-    data = request.json
+    data = read_json_body()
     if not data or 'url' not in data:
-        return jsonify({'error': 'No URL provided'}), 400
+        return ojson({'error': 'No URL provided'}, 400)
     try:
-        print(f"Fetching YAML file from URL: {data['url']}")
+        logger.debug("Fetching YAML file from URL: %s", data['url'])
         # fetch_yaml_file might also need adaptation if it resolves internal references
         # Assuming it's only for self-contained external files for now
         config = fetch_yaml_file(data['url'])
-        return jsonify(config)
+        return ojson(config)
     except Exception as e:
         error_message = f"Error fetching YAML file: {str(e)}"
-        print(error_message)
-        return jsonify({'error': error_message}), 500
+        logger.error(error_message)
+        return ojson({'error': error_message}, 500)
 
-@yaml_bp.route('/crop-image', methods=['POST', 'OPTIONS'])
+@yaml_bp.route('/crop-image', methods=['POST'])
 def crop_image_endpoint():
     """
     Crop an image to remove excess whitespace.
@@ -505,42 +859,44 @@ def crop_image_endpoint():
     Returns:
         The cropped image file for download
     """
-    # Handle preflight OPTIONS request
-    if request.method == 'OPTIONS':
-        response = make_response()
-        response.headers.add('Access-Control-Allow-Origin', 'https://network-visualizer-36300.web.app')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST')
-        return response
-        
-    data = request.json
+    data = read_json_body()
     if not data or 'image_data' not in data:
-        return jsonify({'error': 'No image data provided'}), 400
+        return ojson({'error': 'No image data provided'}, 400)
         
     image_data = data['image_data']
     image_format = data.get('format', 'auto').lower()
     padding = data.get('padding', 20)
     
     if image_format not in ['svg', 'png', 'auto']:
-        return jsonify({'error': 'Invalid format. Must be "svg", "png", or "auto"'}), 400
+        return ojson({'error': 'Invalid format. Must be "svg", "png", or "auto"'}, 400)
     
     try:
-        print(f"Processing image crop request with format: {image_format}, padding: {padding}")
+        logger.debug("Processing image crop request with format: %s, padding: %s", image_format, padding)
         
-        # Crop the image using the service function
-        cropped_data, content_type = crop_image(image_data, image_format, padding)
+        # Decode here and read the raster dimensions from the header, so oversized images never occupy a crop worker
+        binary_data, content_type = process_image_data(image_data)
+        is_svg = image_format == 'svg' or (image_format == 'auto' and content_type == 'image/svg+xml')
+        size = None if is_svg else image_size(binary_data)
+        if size and size[0] * size[1] > CROP_MAX_PIXELS:
+            return ojson({'error': f'Image is too large to crop ({size[0]}x{size[1]} pixels)'}, 413)
+
+        # Crop in the app's process pool so the request thread only waits on the result
+        future = current_app.crop_pool.submit(crop_image_data, binary_data, content_type, image_format, padding)
+        try:
+            cropped_data, content_type = future.result(timeout=CROP_TIMEOUT)
+        except FutureTimeoutError:
+            # Best effort: this only drops a crop still queued; one already running finishes in its worker
+            future.cancel()
+            return ojson({'error': f'Image cropping timed out after {CROP_TIMEOUT:g} seconds'}, 504)
         
         # Return the cropped image with appropriate headers
-        response = make_response(cropped_data)
-        response.headers.set('Content-Type', content_type)
-        response.headers.set('Access-Control-Allow-Origin', 'https://network-visualizer-36300.web.app')
-        return response
+        return Response(cropped_data, mimetype=content_type)
         
     except Exception as e:
         error_message = f"Error cropping image: {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"{error_message}\nTraceback:\n{tb_str}")
-        return jsonify({'error': error_message}), 500
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
+        return ojson({'error': error_message}, 500)
 
 @yaml_bp.route('/list-presets', methods=['GET'])
 def list_presets():
@@ -551,73 +907,110 @@ def list_presets():
         JSON object containing the list of available presets (subfolder names).
     """
     if not gcs_bucket:
-        print("ERROR: GCS bucket not configured. Check GCS_BUCKET_NAME environment variable.")
-        return jsonify({'error': 'GCS not configured on server'}), 500
+        logger.error("GCS bucket not configured. Check GCS_BUCKET_NAME environment variable.")
+        return ojson({'error': 'GCS not configured on server'}, 500)
     
     try:
-        print("=" * 80)
-        print("DETAILED PRESET LISTING DEBUG INFO")
-        print("=" * 80)
-        print(f"DEBUG: Full GCS path being searched: gs://{GCS_BUCKET_NAME}/{PRESETS_PATH}")
-        print(f"DEBUG: Bucket name: {GCS_BUCKET_NAME}")
-        print(f"DEBUG: Preset path prefix: {PRESETS_PATH}")
+        # A folder is a preset only if it has a model.yaml. One names-only LIST answers that for every
+        # folder (no HEAD per folder), and rebuilding the manifest keeps preset lookups in step with it
+        manifest = get_preset_manifest(refresh=True)
+        preset_list = sorted(name for name, blob_names in manifest.items()
+                             if f"{PRESETS_PATH}{name}/model.yaml" in blob_names)
         
-        # List all blobs under the presets path (no delimiter)
-        print(f"DEBUG: Listing all blobs under prefix '{PRESETS_PATH}' to find model.yaml files:")
-        all_blobs = list(storage_client.list_blobs(GCS_BUCKET_NAME, prefix=PRESETS_PATH))
-        print(f"DEBUG: Found {len(all_blobs)} total blobs under prefix.")
-
-        # Get unique parent folder names containing 'model.yaml'
-        prefixes = set()
-        for blob in all_blobs:
-            print(f"DEBUG: Checking blob: {blob.name}")
-            # Check if the blob is named 'model.yaml' and is inside a subfolder of PRESETS_PATH
-            if blob.name.endswith('/model.yaml') and blob.name != PRESETS_PATH + 'model.yaml':
-                # Extract the path part before '/model.yaml'
-                path_part = blob.name[:-len('/model.yaml')] # e.g., "presets/GoogLeNet"
-                print(f"DEBUG: Found model.yaml at: {blob.name}, path part: {path_part}")
-                # Ensure it's under the PRESETS_PATH
-                if path_part.startswith(PRESETS_PATH):
-                    # Get the relative path from PRESETS_PATH
-                    relative_folder_path = path_part[len(PRESETS_PATH):] # e.g., "GoogLeNet"
-                    # Get the top-level folder name
-                    folder_name = relative_folder_path.split('/')[0]
-                    if folder_name: # Ensure it's not empty
-                        print(f"DEBUG: Extracted preset folder name: '{folder_name}'")
-                        prefixes.add(folder_name)
-                    else:
-                         print(f"DEBUG: Skipping blob {blob.name}, couldn't extract valid folder name.")
-                else:
-                     print(f"DEBUG: Skipping blob {blob.name}, path part doesn't start with {PRESETS_PATH}")
-            else:
-                 print(f"DEBUG: Skipping blob {blob.name}, not a model.yaml in a subfolder.")
-        
-        # Convert to sorted list
-        preset_list = sorted(list(prefixes))
-        
-        print(f"DEBUG: Found {len(preset_list)} presets: {preset_list}")
+        logger.debug("Found %d presets: %s", len(preset_list), preset_list)
         
-        # Return the list of presets with CORS header
-        response = make_response(jsonify({'presets': preset_list}))
-        # Allow requests from any origin during development/debugging
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
+        # Return the list of presets
+        return ojson({'presets': preset_list})
     except Exception as e:
         error_message = f"Error listing presets: {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"ERROR: {error_message}\nTraceback:\n{tb_str}")
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
         
-        # Return error with CORS header and more detailed information
-        response = make_response(jsonify({
+        # Return error with more detailed information
+        return ojson({
             'error': error_message,
             'details': {
                 'bucket': GCS_BUCKET_NAME,
                 'presets_path': PRESETS_PATH,
                 'traceback': tb_str
             }
-        }))
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response, 500
+        }, 500)
+
+class PresetNotFoundError(LookupError):
+    """Raised by locate_preset when a preset has no loadable YAML file."""
+
+_preset_manifest = None
+_preset_manifest_lock = threading.Lock()
+
+def get_preset_manifest(refresh=False):
+    """
+    Map each top-level preset name to the blob names under it, built from one names-only LIST of PRESETS_PATH.
+    Built lazily on first use and kept for the life of the process; pass refresh=True to rebuild it.
+
+    Returns:
+        Dict of preset name ("<name>" for "<name>.yaml"/"<name>.yml" or "<name>/...") to a list of full blob names.
+    """
+    global _preset_manifest
+    with _preset_manifest_lock:
+        if _preset_manifest is None or refresh:
+            manifest = {}
+            for blob in storage_client.list_blobs(GCS_BUCKET_NAME, prefix=PRESETS_PATH, fields='items(name),nextPageToken'):
+                top, sep, _ = blob.name[len(PRESETS_PATH):].partition('/')
+                if not sep:
+                    top, extension = os.path.splitext(top)
+                    if extension not in ('.yaml', '.yml'):
+                        continue
+                if top:
+                    manifest.setdefault(top, []).append(blob.name)
+            _preset_manifest = manifest
+            logger.debug("Built preset manifest with %d entries", len(manifest))
+        return _preset_manifest
+
+def refresh_presets():
+    """Drop every memoized preset lookup and cached preset session, and rebuild the manifest from GCS."""
+    locate_preset.cache_clear()
+    # Preset sessions keep processed configs and blob listings like uploads do; replaced files must not hit them
+    for preset_name in [''] + list(get_preset_manifest()):
+        invalidate_upload_cache(f"{PRESET_UPLOAD_ID_PREFIX}{preset_name}")
+    get_preset_manifest(refresh=True)
+
+@functools.lru_cache(maxsize=256)
+def locate_preset(preset_name):
+    """
+    Find a preset's main YAML file from the preset manifest, falling back to a names-only LIST of its
+    prefix for presets added since the manifest was built.
+    Presets are immutable within a deploy, so results are memoized; misses raise and are not cached.
+
+    Returns:
+        Tuple of (preset session upload ID, main file path relative to that session's prefix).
+    """
+    preset_prefix = f"{PRESETS_PATH}{preset_name}"
+    blob_names = get_preset_manifest().get(preset_name)
+    if blob_names is None:
+        # One LIST answers both "is it a single file?" and "what is in the folder?"
+        blob_names = [blob.name for blob in storage_client.list_blobs(GCS_BUCKET_NAME, prefix=preset_prefix, fields='items(name),nextPageToken')]
+
+    # Single-file presets live directly under PRESETS_PATH
+    for extension in ('.yaml', '.yml'):
+        if f"{preset_prefix}{extension}" in blob_names:
+            logger.debug("Found direct preset file: %s%s", preset_prefix, extension)
+            return PRESET_UPLOAD_ID_PREFIX, f"{preset_name}{extension}"
+
+    # If not a direct file, check for folder. The prefix also matches siblings such as
+    # "<name>.txt" or "<name>2/", so keep only the folder's contents
+    preset_path = f"{preset_prefix}/"
+    blob_names = [name for name in blob_names if name.startswith(preset_path)]
+    if not blob_names:
+        raise PresetNotFoundError(f"Preset '{preset_name}' not found as file or folder")
+    logger.debug("Found %d blobs in preset folder '%s'", len(blob_names), preset_name)
+
+    # Prefer model.yaml or main.yaml, otherwise fall back to any YAML file
+    main_name = next((name for name in blob_names if name.endswith('/model.yaml') or name.endswith('/main.yaml')), None)
+    if main_name is None:
+        main_name = next((name for name in blob_names if name.endswith('.yaml') or name.endswith('.yml')), None)
+    if main_name is None:
+        raise PresetNotFoundError(f"No YAML files found in preset folder '{preset_name}'")
+    return f"{PRESET_UPLOAD_ID_PREFIX}{preset_name}", main_name[len(preset_path):]
 
 @yaml_bp.route('/load-preset', methods=['POST'])
 def load_preset():
@@ -626,190 +1019,52 @@ def load_preset():
     
     Request body:
         presetName: The name of the preset to load (subfolder name or file name without extension)
+
+        refresh: (Optional query parameter) "1" to rebuild the preset manifest before the lookup,
+            e.g. after presets were added or replaced in the bucket.
     
     Returns:
         JSON object containing the processed config and the uploadId.
     """
     if not gcs_bucket:
-        return jsonify({'error': 'GCS not configured on server'}), 500
+        return ojson({'error': 'GCS not configured on server'}, 500)
     
-    data = request.json
+    data = read_json_body()
     if not data or 'presetName' not in data:
-        return jsonify({'error': 'No preset name provided'}), 400
+        return ojson({'error': 'No preset name provided'}, 400)
     
     preset_name = data['presetName']
+    if not isinstance(preset_name, str) or not preset_name or '/' in preset_name or preset_name in ('.', '..'):
+        return ojson({'error': f"Invalid preset name: {preset_name}"}, 400)
     
     try:
-        print(f"DEBUG: Loading preset '{preset_name}'")
-        
-        # Generate a new upload ID for this preset
-        upload_id = str(uuid.uuid4())
-        gcs_prefix = f"uploads/{upload_id}/"
+        logger.debug("Loading preset '%s'", preset_name)
         
-        # First check if this is a direct YAML file
-        direct_yaml_path = f"{PRESETS_PATH}{preset_name}.yaml"
-        direct_yml_path = f"{PRESETS_PATH}{preset_name}.yml"
-        
-        # Check if the preset is a direct YAML file
-        direct_yaml_blob = None
-        try:
-            direct_yaml_blob = gcs_bucket.blob(direct_yaml_path)
-            if direct_yaml_blob.exists():
-                print(f"DEBUG: Found direct YAML file: {direct_yaml_path}")
-                main_file = f"{preset_name}.yaml"
-                
-                # Copy the YAML file to the uploads location
-                new_blob_name = f"{gcs_prefix}{preset_name}.yaml"
-                new_blob = gcs_bucket.blob(new_blob_name)
-                
-                # Copy the blob
-                token = None
-                rewrite_token = None
-                while True:
-                    token, rewrite_token, bytes_rewritten = new_blob.rewrite(
-                        source=direct_yaml_blob, token=rewrite_token
-                    )
-                    if token is None:
-                        break
-                
-                print(f"DEBUG: Copied {direct_yaml_path} to {new_blob_name}")
-                
-                # Process the YAML file
-                print(f"DEBUG: Processing direct YAML file: {preset_name}.yaml")
-                config = process_yaml_file(upload_id=upload_id, relative_path=f"{preset_name}.yaml")
-                
-                # Return config and the upload ID with CORS header
-                response = make_response(jsonify({'config': config, 'uploadId': upload_id}))
-                response.headers['Access-Control-Allow-Origin'] = 'https://network-visualizer-36300.web.app'
-                return response
-        except Exception as e:
-            print(f"DEBUG: Error checking for direct YAML file: {e}")
-            # Continue to check for folder
-        
-        # If not a direct file, check for .yml extension
+        # Presets are immutable, so they are processed in place under presets/ rather than copied to a new
+        # uploads/ prefix. The returned uploadId names the preset, so get-subgraph resolves against it too.
+        if request.args.get('refresh') in ('1', 'true'):
+            refresh_presets()
         try:
-            direct_yml_blob = gcs_bucket.blob(direct_yml_path)
-            if direct_yml_blob.exists():
-                print(f"DEBUG: Found direct YML file: {direct_yml_path}")
-                main_file = f"{preset_name}.yml"
-                
-                # Copy the YAML file to the uploads location
-                new_blob_name = f"{gcs_prefix}{preset_name}.yml"
-                new_blob = gcs_bucket.blob(new_blob_name)
-                
-                # Copy the blob
-                token = None
-                rewrite_token = None
-                while True:
-                    token, rewrite_token, bytes_rewritten = new_blob.rewrite(
-                        source=direct_yml_blob, token=rewrite_token
-                    )
-                    if token is None:
-                        break
-                
-                print(f"DEBUG: Copied {direct_yml_path} to {new_blob_name}")
-                
-                # Process the YAML file
-                print(f"DEBUG: Processing direct YML file: {preset_name}.yml")
-                config = process_yaml_file(upload_id=upload_id, relative_path=f"{preset_name}.yml")
-                
-                # Return config and the upload ID with CORS header
-                response = make_response(jsonify({'config': config, 'uploadId': upload_id}))
-                response.headers['Access-Control-Allow-Origin'] = 'https://network-visualizer-36300.web.app'
-                return response
-        except Exception as e:
-            print(f"DEBUG: Error checking for direct YML file: {e}")
-            # Continue to check for folder
-        
-        # If not a direct file, check for folder
-        preset_path = f"{PRESETS_PATH}{preset_name}/"
-        main_file = "model.yaml"  # Default main file name
-        
-        print(f"DEBUG: Checking for folder at path: {preset_path}")
-        
-        # Check if the preset exists as a folder
-        blobs = list(storage_client.list_blobs(GCS_BUCKET_NAME, prefix=preset_path))
-        if not blobs:
-            print(f"DEBUG: No blobs found with prefix '{preset_path}'")
-            return jsonify({'error': f"Preset '{preset_name}' not found as file or folder"}), 404
-        
-        print(f"DEBUG: Found {len(blobs)} blobs in preset folder '{preset_name}'")
-        for blob in blobs:
-            print(f"DEBUG: Found blob: {blob.name}")
-        
-        # Find the main file
-        main_file_blob = None
-        for blob in blobs:
-            if blob.name.endswith('/model.yaml') or blob.name.endswith('/main.yaml'):
-                main_file_blob = blob
-                main_file = blob.name[len(preset_path):]  # Get relative path
-                print(f"DEBUG: Found main file: {main_file}")
-                break
-        
-        if not main_file_blob:
-            # If no model.yaml or main.yaml found, look for any .yaml file
-            for blob in blobs:
-                if blob.name.endswith('.yaml') or blob.name.endswith('.yml'):
-                    main_file_blob = blob
-                    main_file = blob.name[len(preset_path):]  # Get relative path
-                    print(f"DEBUG: Using {main_file} as main file")
-                    break
-        
-        if not main_file_blob:
-            print(f"DEBUG: No YAML files found in preset folder '{preset_name}'")
-            return jsonify({'error': f"No YAML files found in preset folder '{preset_name}'"}), 404
-        
-        print(f"DEBUG: Generated upload ID: {upload_id}")
-        
-        # Copy each blob to the new upload location
-        for blob in blobs:
-            # Get the relative path within the preset folder
-            relative_path = blob.name[len(preset_path):]
-            if not relative_path:  # Skip the folder itself
-                continue
-                
-            # Create a new blob in the uploads location
-            new_blob_name = f"{gcs_prefix}{relative_path}"
-            new_blob = gcs_bucket.blob(new_blob_name)
-            
-            # Copy the blob
-            token = None
-            rewrite_token = None
-            while True:
-                token, rewrite_token, bytes_rewritten = new_blob.rewrite(
-                    source=blob, token=rewrite_token
-                )
-                if token is None:
-                    break
-            
-            print(f"DEBUG: Copied {blob.name} to {new_blob_name}")
+            upload_id, main_file = locate_preset(preset_name)
+        except PresetNotFoundError as e:
+            logger.debug("%s", e)
+            return ojson({'error': str(e)}, 404)
         
         # Process the main YAML file
-        print(f"DEBUG: Processing main file: {main_file}")
+        logger.debug("Processing main file: %s", main_file)
         config = process_yaml_file(upload_id=upload_id, relative_path=main_file)
         
         # Check for embedded errors
-        processing_errors = []
-        if isinstance(config, dict) and 'modules' in config:
-            for module_name, module_data in config['modules'].items():
-                if isinstance(module_data, dict) and isinstance(module_data.get('config'), dict) and 'error' in module_data['config']:
-                    processing_errors.append({
-                        'module': module_name,
-                        'error': module_data['config']['error']
-                    })
+        processing_errors = collect_module_errors(config)
         if processing_errors:
-            print(f"Found errors during processing: {processing_errors}")
-            # Clean up GCS on error
-            delete_gcs_prefix(gcs_prefix)
-            return jsonify({'error': 'Errors occurred during YAML processing.', 'details': processing_errors}), 422
+            logger.warning(f"Found errors during processing: {processing_errors}")
+            return ojson({'error': 'Errors occurred during YAML processing.', 'details': processing_errors}, 422)
         
-        # Return config and the upload ID with CORS header
-        response = make_response(jsonify({'config': config, 'uploadId': upload_id}))
-        response.headers['Access-Control-Allow-Origin'] = 'https://network-visualizer-36300.web.app'
-        return response
+        # Return config and the upload ID
+        return ojson({'config': config, 'uploadId': upload_id})
         
     except Exception as e:
         error_message = f"Error loading preset '{preset_name}': {str(e)}"
         tb_str = traceback.format_exc()
-        print(f"{error_message}\nTraceback:\n{tb_str}")
-        return jsonify({'error': error_message}), 500
+        logger.error(f"{error_message}\nTraceback:\n{tb_str}")
+        return ojson({'error': error_message}, 500)
@@ -1,88 +1,233 @@
 import base64
+import binascii
 import io
+import logging
 import re
-from typing import Tuple, Optional, Union
+from typing import List, Tuple, Optional, Union
 import numpy as np
 from PIL import Image
 from lxml import etree
 
+logger = logging.getLogger(__name__)
 
-def crop_png(image_data: bytes, padding: int = 20) -> bytes:
-    """
-    Crop a PNG image to remove excess whitespace.
+# Path data tokens used by crop_svg, compiled once at import: a command letter or a number
+SVG_PATH_TOKEN_RE = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+# Arguments consumed by one repetition of each path command
+SVG_PATH_ARG_COUNTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+# Arc flags are a single 0/1 character and may be written without separators, as in "a10 10 0 1150 50"
+SVG_ARC_FLAG_RE = re.compile(r"[\s,]*([01])")
 
-    Args:
-        image_data: Binary PNG data
-        padding: Padding in pixels to add around the content
+
+def _content_bounds_rgb(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Find the non-white content of an RGB/RGBA image entirely in Pillow's C loops, without a NumPy copy.
 
     Returns:
-        Binary data of the cropped PNG
+        (left, top, right, bottom) with right/bottom exclusive, or None if the image is blank
     """
-    # Load the image from binary data
-    image = Image.open(io.BytesIO(image_data))
+    # Converting RGBA to RGB just drops the alpha band
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # One matrix conversion computes 765 - (R + G + B), the summed distance from white, for every pixel.
+    # It saturates at 255, which is still above the threshold, so clipping never hides content
+    whiteness = image.convert("L", matrix=(-1, -1, -1, 765))
+    return whiteness.point(lambda v: 255 if v > 30 else 0).getbbox()
 
-    # Convert to numpy array for processing
-    img_array = np.array(image)
 
-    print(f"Image shape: {img_array.shape}, dtype: {img_array.dtype}")
+def _content_bounds_single_band(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Same rule as _content_bounds_rgb for palette, grayscale and bilevel images, without expanding them to RGB:
+    each of the 256 possible band values is classified once through a lookup table.
 
-    # Always use RGB channels to find non-white pixels, ignoring alpha if present
-    print("Processing image using RGB channels only")
+    Returns:
+        (left, top, right, bottom) with right/bottom exclusive, or None if the image is blank
+    """
+    if image.mode == "P":
+        palette = image.getpalette() or []
+        # Indices past the end of a short palette have no colour; count them as content rather than crop them away
+        lut = [
+            255 if i + 3 > len(palette) or 765 - sum(palette[i:i + 3]) > 30 else 0
+            for i in range(0, 768, 3)
+        ]
+        # Threshold the raw palette indices as an L image
+        band = Image.frombytes("L", image.size, image.tobytes())
+    else:
+        # A gray level v is (v, v, v) in RGB, i.e. 3 * (255 - v) away from white
+        lut = [255 if 3 * (255 - v) > 30 else 0 for v in range(256)]
+        band = image if image.mode == "L" else image.convert("L")
+    return band.point(lut).getbbox()
+
+
+def _content_bounds_array(img_array: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    NumPy fallback of _content_bounds_rgb for other multi-band modes.
 
+    Returns:
+        (left, top, right, bottom) with right/bottom exclusive, or None if the image is blank
+    """
     # Extract RGB channels, ignoring alpha if it exists
     if len(img_array.shape) > 2:  # Color image
         # Use only the first 3 channels (RGB)
         rgb_array = img_array[:, :, :3]
 
-        # Calculate "whiteness" - how close to white (255,255,255) each pixel is
-        whiteness = np.sum(np.abs(rgb_array.astype(np.int32) - 255), axis=2)
+        # Calculate "whiteness" - how close to white (255,255,255) each pixel is.
+        # 255 - x cannot underflow uint8, and three channels sum to at most 765, so uint16 holds it
+        # without the int32 upcast and abs() copies of the whole image
+        whiteness = np.sum(255 - rgb_array, axis=2, dtype=np.uint16)
 
         # Find pixels that are significantly non-white
         non_white_mask = whiteness > 30
-        non_empty_rows = np.where(np.any(non_white_mask, axis=1))[0]
-        non_empty_columns = np.where(np.any(non_white_mask, axis=0))[0]
     else:
         # This case shouldn't happen based on requirements
-        print("Warning: Unexpected image format")
-        non_empty_rows = np.array([])
-        non_empty_columns = np.array([])
+        logger.warning("Unexpected image format with shape %s", img_array.shape)
+        return None
+
+    row_has_content = np.any(non_white_mask, axis=1)
+    if not row_has_content.any():
+        return None
+
+    # First and last content row/column: argmax stops at the first True from either end,
+    # so no index arrays are built for the min/max
+    first_row = int(np.argmax(row_has_content))
+    last_row = len(row_has_content) - 1 - int(np.argmax(row_has_content[::-1]))
+    # Rows outside that band have no content, so the column pass only scans the band
+    column_has_content = np.any(non_white_mask[first_row:last_row + 1], axis=0)
+    first_column = int(np.argmax(column_has_content))
+    last_column = len(column_has_content) - 1 - int(np.argmax(column_has_content[::-1]))
+    return first_column, first_row, last_column + 1, last_row + 1
 
-    print(
-        f"non empty rows from {non_empty_rows[0] if len(non_empty_rows) > 0 else 'N/A'} to {non_empty_rows[-1] if len(non_empty_rows) > 0 else 'N/A'}"
-    )
-    print(
-        f"non empty columns from {non_empty_columns[0] if len(non_empty_columns) > 0 else 'N/A'} to {non_empty_columns[-1] if len(non_empty_columns) > 0 else 'N/A'}"
-    )
+
+def crop_png(image_data: bytes, padding: int = 20, compress_level: int = 1) -> bytes:
+    """
+    Crop a PNG image to remove excess whitespace.
+
+    Args:
+        image_data: Binary PNG data
+        padding: Padding in pixels to add around the content
+        compress_level: zlib level (0-9) for the cropped PNG; 1 encodes several times faster than
+            Pillow's default 6 at a slightly larger size
+
+    Returns:
+        Binary data of the cropped PNG
+    """
+    # Load the image from binary data
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+
+    logger.debug("Image size: %dx%d, mode: %s", width, height, image.mode)
+
+    # Always use RGB channels to find non-white pixels, ignoring alpha if present
+    if image.mode in ("RGB", "RGBA"):
+        bounds = _content_bounds_rgb(image)
+    elif image.mode in ("P", "L", "1"):
+        bounds = _content_bounds_single_band(image)
+    else:
+        bounds = _content_bounds_array(np.array(image))
+
+    # Only PNG input can be handed back as is; anything else sent here must still be re-encoded as PNG
+    is_png = image.format == "PNG"
 
     # If there are no non-empty pixels, return the original image
-    if len(non_empty_rows) == 0 or len(non_empty_columns) == 0:
-        print("No content found in image, returning original")
+    if bounds is None:
+        logger.debug("No content found in image, returning original")
+        # A PNG input needs no decode and re-encode
+        if is_png:
+            return image_data
         output = io.BytesIO()
-        image.save(output, format="PNG")
+        image.save(output, format="PNG", compress_level=compress_level)
         return output.getvalue()
 
-    # Calculate the crop boundaries with padding
-    crop_top = max(0, min(non_empty_rows) - padding)
-    crop_bottom = min(img_array.shape[0], max(non_empty_rows) + padding + 1)
-    crop_left = max(0, min(non_empty_columns) - padding)
-    crop_right = min(img_array.shape[1], max(non_empty_columns) + padding + 1)
+    content_left, content_top, content_right, content_bottom = bounds
+    logger.debug("Content rows %d-%d, columns %d-%d", content_top, content_bottom - 1, content_left, content_right - 1)
 
-    print(
-        f"Crop boundaries: top={crop_top}, bottom={crop_bottom}, left={crop_left}, right={crop_right}"
-    )
-    print(
-        f"Original size: {img_array.shape[1]}x{img_array.shape[0]}, Cropped size: {crop_right - crop_left}x{crop_bottom - crop_top}"
+    # Calculate the crop boundaries with padding
+    crop_top = max(0, content_top - padding)
+    crop_bottom = min(height, content_bottom + padding)
+    crop_left = max(0, content_left - padding)
+    crop_right = min(width, content_right + padding)
+
+    logger.debug(
+        "Crop boundaries: top=%d, bottom=%d, left=%d, right=%d (%dx%d -> %dx%d)",
+        crop_top, crop_bottom, crop_left, crop_right, width, height, crop_right - crop_left, crop_bottom - crop_top,
     )
 
+    # Padding reaches every edge, so the crop would reproduce the original
+    if (crop_left, crop_top, crop_right, crop_bottom) == (0, 0, width, height) and is_png:
+        return image_data
+
     # Crop the image
     cropped_image = image.crop((crop_left, crop_top, crop_right, crop_bottom))
 
     # Save to bytes
     output = io.BytesIO()
-    cropped_image.save(output, format="PNG", dpi=(300,300))
+    cropped_image.save(output, format="PNG", dpi=(300,300), compress_level=compress_level)
     return output.getvalue()
 
 
+def _path_points(path_data: str) -> List[Tuple[float, float]]:
+    """
+    Absolute coordinates of the end and control points in an SVG path's d attribute.
+    A curve stays within the hull of its control points, so their box contains the drawn path;
+    arcs contribute their end points only.
+
+    Args:
+        path_data: Value of the d attribute
+
+    Returns:
+        List of (x, y) points in drawing order
+    """
+    points = []
+    x = y = start_x = start_y = 0.0
+    command = None
+    args = []
+    pos = 0
+    while True:
+        # The large-arc and sweep flags are arguments 4 and 5 of an arc
+        flag = SVG_ARC_FLAG_RE.match(path_data, pos) if command in ("A", "a") and len(args) in (3, 4) else None
+        if flag:
+            command_token, number = "", flag.group(1)
+            pos = flag.end()
+        else:
+            token = SVG_PATH_TOKEN_RE.search(path_data, pos)
+            if token is None:
+                break
+            command_token, number = token.group(1), token.group(2)
+            pos = token.end()
+        if command_token:
+            command, args = command_token, []
+            if command in "Zz":
+                x, y = start_x, start_y
+            continue
+        if command is None or command in "Zz":
+            raise ValueError(f"coordinate {number} outside a path command")
+        args.append(float(number))
+        kind = command.upper()
+        if len(args) < SVG_PATH_ARG_COUNTS[kind]:
+            continue
+
+        # Relative commands are offsets from the current point
+        base_x, base_y = (x, y) if command.islower() else (0.0, 0.0)
+        if kind == "H":
+            x = base_x + args[0]
+            points.append((x, y))
+        elif kind == "V":
+            y = base_y + args[0]
+            points.append((x, y))
+        elif kind == "A":
+            x, y = base_x + args[5], base_y + args[6]
+            points.append((x, y))
+        else:
+            for i in range(0, len(args), 2):
+                points.append((base_x + args[i], base_y + args[i + 1]))
+            x, y = points[-1]
+        if kind == "M":
+            start_x, start_y = x, y
+            # Pairs after the first one of a moveto are implicit linetos
+            command = "l" if command == "m" else "L"
+        args = []
+    return points
+
+
 def crop_svg(svg_data: bytes, padding: int = 20) -> bytes:
     """
     Crop an SVG image to remove excess whitespace.
@@ -105,77 +250,78 @@ def crop_svg(svg_data: bytes, padding: int = 20) -> bytes:
         padding = 20
         
     try:
-        # Parse the SVG
-        svg_str = svg_data.decode("utf-8")
-        root = etree.fromstring(svg_str.encode("utf-8"))
-        
-        # Find all elements with x, y, width, height attributes
-        elements = root.xpath("//*[@x and @y and @width and @height]")
-        
-        if not elements:
-            # Try to find elements with points (like polygons)
-            elements = root.xpath("//*[@points]")
-            
-            if not elements:
-                print("No elements with coordinates found in SVG, returning original")
-                return svg_data
+        # Parse the SVG; lxml reads bytes directly and honours any encoding declaration
+        root = etree.fromstring(svg_data)
         
         # Initialize min/max coordinates
         min_x, min_y = float("inf"), float("inf")
         max_x, max_y = float("-inf"), float("-inf")
+        # Whether any element has x/y/width/height or points; paths alone are not enough to crop
+        found_elements = False
         
         try:
-            # Process elements with x, y, width, height
-            for elem in root.xpath("//*[@x and @y and @width and @height]"):
-                try:
-                    x = float(elem.get("x", 0))
-                    y = float(elem.get("y", 0))
-                    width = float(elem.get("width", 0))
-                    height = float(elem.get("height", 0))
-                    
-                    min_x = min(min_x, x)
-                    min_y = min(min_y, y)
-                    max_x = max(max_x, x + width)
-                    max_y = max(max_y, y + height)
-                except (TypeError, ValueError) as e:
-                    print(f"Warning: Could not parse element coordinates: {e}")
-                    continue
-            
-            # Process elements with points (like polygons)
-            for elem in root.xpath("//*[@points]"):
-                try:
-                    points_str = elem.get("points", "")
-                    points = re.findall(r"(\d+(?:\.\d+)?),(\d+(?:\.\d+)?)", points_str)
-                    
-                    for x_str, y_str in points:
-                        x, y = float(x_str), float(y_str)
+            # One pass over the tree instead of a separate XPath query per element kind
+            for elem in root.iter(tag=etree.Element):
+                attrs = elem.attrib
+                
+                # Process elements with x, y, width, height
+                if "x" in attrs and "y" in attrs and "width" in attrs and "height" in attrs:
+                    found_elements = True
+                    try:
+                        x = float(attrs["x"])
+                        y = float(attrs["y"])
+                        width = float(attrs["width"])
+                        height = float(attrs["height"])
+                        
                         min_x = min(min_x, x)
                         min_y = min(min_y, y)
-                        max_x = max(max_x, x)
-                        max_y = max(max_y, y)
-                except (TypeError, ValueError) as e:
-                    print(f"Warning: Could not parse points: {e}")
-                    continue
-            
-            # Process path elements
-            for elem in root.xpath("//path[@d]"):
-                try:
-                    path_data = elem.get("d", "")
-                    coords = re.findall(r"[ML]\s*(\d+(?:\.\d+)?)[, ](\d+(?:\.\d+)?)", path_data)
-                    
-                    for x_str, y_str in coords:
-                        x, y = float(x_str), float(y_str)
-                        min_x = min(min_x, x)
-                        min_y = min(min_y, y)
-                        max_x = max(max_x, x)
-                        max_y = max(max_y, y)
-                except (TypeError, ValueError) as e:
-                    print(f"Warning: Could not parse path data: {e}")
-                    continue
+                        max_x = max(max_x, x + width)
+                        max_y = max(max_y, y + height)
+                    except (TypeError, ValueError) as e:
+                        print(f"Warning: Could not parse element coordinates: {e}")
+                
+                # Process elements with points (like polygons)
+                if "points" in attrs:
+                    found_elements = True
+                    try:
+                        # Dense polygons carry thousands of numbers: parse and reduce them in NumPy.
+                        # SVG separates them with commas and/or whitespace, in x, y order
+                        points = np.fromstring(attrs["points"].replace(",", " "), sep=" ")
+                        if points.size % 2:
+                            raise ValueError(f"odd number of coordinates ({points.size})")
+                        if points.size:
+                            points = points.reshape(-1, 2)
+                            low_x, low_y = points.min(axis=0)
+                            high_x, high_y = points.max(axis=0)
+                            min_x = min(min_x, float(low_x))
+                            min_y = min(min_y, float(low_y))
+                            max_x = max(max_x, float(high_x))
+                            max_y = max(max_y, float(high_y))
+                    except (TypeError, ValueError) as e:
+                        print(f"Warning: Could not parse points: {e}")
+                
+                # Process path elements (un-namespaced, as the former //path[@d] query matched)
+                if elem.tag == "path" and "d" in attrs:
+                    try:
+                        # Every command kind counts, absolute or relative, not only M/L
+                        coords = np.array(_path_points(attrs["d"]))
+                        if coords.size:
+                            low_x, low_y = coords.min(axis=0)
+                            high_x, high_y = coords.max(axis=0)
+                            min_x = min(min_x, float(low_x))
+                            min_y = min(min_y, float(low_y))
+                            max_x = max(max_x, float(high_x))
+                            max_y = max(max_y, float(high_y))
+                    except (TypeError, ValueError) as e:
+                        print(f"Warning: Could not parse path data: {e}")
         except Exception as e:
             print(f"Error processing SVG elements: {e}")
             return svg_data
         
+        if not found_elements:
+            print("No elements with coordinates found in SVG, returning original")
+            return svg_data
+        
         # If no valid coordinates found, return original
         if min_x == float("inf") or min_y == float("inf"):
             print("No valid coordinates found in SVG, returning original")
@@ -220,14 +366,16 @@ def process_image_data(data_url: str) -> Tuple[bytes, str]:
     """
     # Check if it's a data URL
     if data_url.startswith("data:"):
-        # Split the header from the base64 data
-        header, encoded_data = data_url.split(",", 1)
+        # Find the header/data boundary without copying the (possibly multi-MB) payload out
+        comma = data_url.find(",")
+        if comma == -1:
+            raise ValueError("Malformed data URL: no ',' after the header")
 
         # Extract the content type
-        content_type = header.split(";")[0].split(":")[1]
+        content_type = data_url[:comma].partition(";")[0].partition(":")[2]
 
-        # Decode the base64 data
-        binary_data = base64.b64decode(encoded_data)
+        # Decode the base64 data straight from a view of the encoded URL (one copy instead of two)
+        binary_data = binascii.a2b_base64(memoryview(data_url.encode("ascii"))[comma + 1:])
     else:
         # Assume it's already base64 encoded
         binary_data = base64.b64decode(data_url)
@@ -242,23 +390,36 @@ def process_image_data(data_url: str) -> Tuple[bytes, str]:
     return binary_data, content_type
 
 
-def crop_image(
-    data_url: str, format_type: str = "auto", padding: int = 20
+def image_size(binary_data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read a raster image's (width, height) from its header without decoding the pixels.
+
+    Returns:
+        (width, height), or None if Pillow cannot identify the data
+    """
+    try:
+        with Image.open(io.BytesIO(binary_data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def crop_image_data(
+    binary_data: bytes, content_type: str, format_type: str = "auto", padding: int = 20, compress_level: int = 1
 ) -> Tuple[bytes, str]:
     """
-    Crop an image from a data URL.
+    Crop decoded image data, as returned by process_image_data.
 
     Args:
-        data_url: The data URL string
-        format_type: 'png', 'svg', or 'auto' to determine from the data
+        binary_data: The image bytes
+        content_type: The content type from process_image_data
+        format_type: 'png', 'svg', or 'auto' to determine from the content type
         padding: Padding in pixels to add around the content
+        compress_level: zlib level (0-9) for cropped PNGs; ignored for SVG
 
     Returns:
         Tuple of (cropped_binary_data, content_type)
     """
-    # Process the data URL
-    binary_data, content_type = process_image_data(data_url)
-
     # Determine the format if set to auto
     if format_type == "auto":
         if content_type == "image/svg+xml":
@@ -271,5 +432,25 @@ def crop_image(
         cropped_data = crop_svg(binary_data, padding)
         return cropped_data, "image/svg+xml"
     else:
-        cropped_data = crop_png(binary_data, padding)
+        cropped_data = crop_png(binary_data, padding, compress_level)
         return cropped_data, "image/png"
+
+
+def crop_image(
+    data_url: str, format_type: str = "auto", padding: int = 20, compress_level: int = 1
+) -> Tuple[bytes, str]:
+    """
+    Crop an image from a data URL.
+
+    Args:
+        data_url: The data URL string
+        format_type: 'png', 'svg', or 'auto' to determine from the data
+        padding: Padding in pixels to add around the content
+        compress_level: zlib level (0-9) for cropped PNGs; ignored for SVG
+
+    Returns:
+        Tuple of (cropped_binary_data, content_type)
+    """
+    # Process the data URL
+    binary_data, content_type = process_image_data(data_url)
+    return crop_image_data(binary_data, content_type, format_type, padding, compress_level)
@@ -9,6 +9,8 @@ YAML as a temporary file for the React Flow pipeline to use.
 
 import os
 import sys
+import hashlib
+import functools
 import tempfile
 import argparse
 from pathlib import Path
@@ -16,6 +18,7 @@ from typing import Dict, Any, Optional
 
 try:
     from omegaconf import OmegaConf
+    from omegaconf._utils import get_yaml_loader
     import yaml
 except ImportError:
     print("Required packages not found. Please install them manually with:")
@@ -25,38 +28,123 @@ except ImportError:
     print("For macOS: brew install python3 && pip3 install omegaconf pyyaml")
     sys.exit(1)
 
+# libyaml's C loader and dumper are several times faster; fall back to the pure-Python ones without it
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+# Values a resolved config may hold without OmegaConf having anything to check or convert
+_PLAIN_SCALARS = (str, int, float, bool, type(None))
 
-def process_yaml(input_file: str, output_file: Optional[str] = None) -> str:
+
+class YamlLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    """
+    libyaml's safe loader with the YAML rules of OmegaConf.load: its resolver table reads `1e-5` as a float
+    and leaves timestamps as strings, and duplicate keys are an error.
+    """
+    yaml_implicit_resolvers = {
+        key: list(resolvers) for key, resolvers in get_yaml_loader().yaml_implicit_resolvers.items()
+    }
+
+    def construct_mapping(self, node, deep=False):
+        keys = set()
+        for key_node, _ in node.value:
+            if key_node.tag != yaml.resolver.BaseResolver.DEFAULT_SCALAR_TAG:
+                continue
+            if key_node.value in keys:
+                raise yaml.constructor.ConstructorError(
+                    "while constructing a mapping", node.start_mark,
+                    f"found duplicate key {key_node.value}", key_node.start_mark,
+                )
+            keys.add(key_node.value)
+        return super().construct_mapping(node, deep=deep)
+
+
+def _is_plain_tree(value: Any) -> bool:
+    """True if value holds only str-keyed mappings, lists and plain scalars, which OmegaConf returns unchanged."""
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if not all(isinstance(key, str) for key in node):
+                return False
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif not isinstance(node, _PLAIN_SCALARS):
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=128)
+def _load_and_resolve(abs_path: str, mtime_ns: int, size: int) -> Any:
+    """
+    Load a YAML file and resolve its interpolations. Memoized on the file's version (mtime and size),
+    so a long-lived caller processing an unchanged file again skips parsing and resolution.
+    The result is shared between calls and must not be modified.
+    """
+    # Load the YAML file with libyaml (OmegaConf.load would use the pure-Python loader). Like OmegaConf.load,
+    # an empty file is an empty config
+    with open(abs_path, 'rb') as f:
+        raw = f.read()
+    loaded = yaml.load(raw, Loader=YamlLoader)
+    if loaded is None:
+        loaded = {}
+    # A plain mapping without interpolations is already its resolved form; only wrap the rest in OmegaConf,
+    # which also rejects the value types it does not support
+    if isinstance(loaded, dict) and b'${' not in raw and _is_plain_tree(loaded):
+        return loaded
+    return OmegaConf.to_container(OmegaConf.create(loaded), resolve=True)
+
+
+def process_yaml(input_file: str, output_file: Optional[str] = None, force: bool = False) -> str:
     """
     Process a YAML file using OmegaConf to resolve interpolation expressions.
     
+    Without an output file, the result goes to a temporary file named after the input's path, mtime
+    and size, and an existing one is reused instead of processing the unchanged input again.
+    
     Args:
         input_file: Path to the input YAML file
         output_file: Path to save the processed YAML file (optional)
+        force: Process the input even if an up-to-date temporary file exists
         
     Returns:
         Path to the processed YAML file
     """
-    # Load the YAML file using OmegaConf
     try:
-        config = OmegaConf.load(input_file)
-    except Exception as e:
+        st = os.stat(input_file)
+    except OSError as e:
         print(f"Error loading YAML file: {e}")
         sys.exit(1)
+    abs_path = os.path.abspath(input_file)
     
-    # Resolve interpolation expressions
-    resolved_config = OmegaConf.to_container(config, resolve=True)
-    
-    # If no output file is specified, create a temporary file
+    # If no output file is specified, use a temporary file keyed by the input's current version
     if output_file is None:
-        temp_dir = tempfile.gettempdir()
+        key = hashlib.blake2b(f"{abs_path}|{st.st_mtime_ns}|{st.st_size}".encode()).hexdigest()[:16]
         input_filename = os.path.basename(input_file)
-        output_file = os.path.join(temp_dir, f"processed_{input_filename}")
+        output_file = os.path.join(tempfile.gettempdir(), f"processed_{key}_{input_filename}")
+        if not force and os.path.exists(output_file):
+            print(f"Processed YAML saved to: {output_file}")
+            return output_file
+    
+    # Load the YAML file and resolve interpolation expressions
+    try:
+        if force:
+            _load_and_resolve.cache_clear()
+        resolved_config = _load_and_resolve(abs_path, st.st_mtime_ns, st.st_size)
+    except Exception as e:
+        print(f"Error loading YAML file: {e}")
+        sys.exit(1)
     
-    # Save the processed YAML to the output file
+    # Save the processed YAML to the output file. Write a sibling first and rename it into place,
+    # so an interrupted run never leaves a partial file that a later run would reuse
     try:
-        with open(output_file, 'w') as f:
-            yaml.dump(resolved_config, f, default_flow_style=False)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                yaml.dump(resolved_config, f, Dumper=YamlDumper, default_flow_style=False)
+            os.replace(tmp_path, output_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
     except Exception as e:
         print(f"Error saving processed YAML file: {e}")
         sys.exit(1)
@@ -70,11 +158,12 @@ def main():
     parser = argparse.ArgumentParser(description='Process YAML files with OmegaConf')
     parser.add_argument('input_file', help='Path to the input YAML file')
     parser.add_argument('-o', '--output', help='Path to save the processed YAML file (optional)')
+    parser.add_argument('--force', action='store_true', help='Reprocess even if an up-to-date processed file exists')
     
     args = parser.parse_args()
     
     # Process the YAML file
-    output_file = process_yaml(args.input_file, args.output)
+    output_file = process_yaml(args.input_file, args.output, force=args.force)
     
     # Return the path to the processed file
     return output_file
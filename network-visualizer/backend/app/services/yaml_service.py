@@ -1,125 +1,668 @@
 import os
+import copy
+import datetime
+import math
+import posixpath
+import re
+import zipfile
+import json
+import hashlib
+import logging
 import yaml
 import requests
-import tempfile # Still needed for local temp copies
+import tempfile # Sidecar cache files
 import shutil
-import traceback
-from typing import Dict, Any, Optional, List, Tuple
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, Iterator, Union, FrozenSet, Set
+from flask import current_app, has_app_context
 from omegaconf import OmegaConf
 from google.cloud import storage
 from google.api_core import exceptions as gcs_exceptions # For specific GCS error handling
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Prefer the libyaml-backed loader (several times faster); fall back to the pure-Python one
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+    logger.warning("PyYAML was built without libyaml; falling back to the pure-Python SafeLoader")
+
 # --- GCS Configuration ---
 # Get bucket name from environment variable
 GCS_BUCKET_NAME = os.environ.get('GCS_BUCKET_NAME')
 if not GCS_BUCKET_NAME:
-    print("WARNING: GCS_BUCKET_NAME environment variable not set.")
+    logger.warning("GCS_BUCKET_NAME environment variable not set.")
 
-# Initialize GCS client
+# Connections kept per host by the GCS HTTP session; the default of 10 starves the concurrent upload/copy pools
+GCS_HTTP_POOL_SIZE = int(os.environ.get('GCS_HTTP_POOL_SIZE', 64))
+
+def _make_storage_client() -> storage.Client:
+    """Creates the process-wide GCS client, with a connection pool large enough for concurrent blob calls."""
+    client = storage.Client()
+    # max_retries stays 0: the storage library already retries idempotent calls itself
+    adapter = requests.adapters.HTTPAdapter(pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE)
+    client._http.mount('https://', adapter)
+    return client
+
+# Initialize GCS client (shared with the routes module, so both reuse the same pooled connections)
 try:
-    storage_client = storage.Client()
+    storage_client = _make_storage_client()
     gcs_bucket = storage_client.bucket(GCS_BUCKET_NAME) if GCS_BUCKET_NAME else None
 except Exception as e:
-    print(f"ERROR: Failed to initialize GCS client: {e}")
+    logger.error("Failed to initialize GCS client: %s", e)
     storage_client = None
     gcs_bucket = None
+# Preset sessions read presets/ in place instead of copying them under uploads/. Their upload IDs are
+# PRESET_UPLOAD_ID_PREFIX followed by the preset folder name (empty for single-file presets).
+PRESETS_PATH = os.environ.get('PRESETS_PATH', 'presets/')
+PRESET_UPLOAD_ID_PREFIX = 'preset:'
+
+def is_preset_upload_id(upload_id: str) -> bool:
+    """True for upload IDs that refer to a preset in place rather than to an uploads/ prefix."""
+    return upload_id.startswith(PRESET_UPLOAD_ID_PREFIX)
+
+def upload_gcs_prefix(upload_id: str) -> str:
+    """Returns the GCS prefix (with trailing slash) holding the files of an upload or preset session."""
+    if is_preset_upload_id(upload_id):
+        folder = upload_id[len(PRESET_UPLOAD_ID_PREFIX):]
+        return f"{PRESETS_PATH}{folder}/" if folder else PRESETS_PATH
+    return f"uploads/{upload_id}/"
 # --- End GCS Configuration ---
 
+# --- Parsed YAML Caches ---
+# Process-level LRUs of parsed YAML. Cached values are never handed out directly;
+# callers always receive a copy (see _fast_copy) so downstream mutation cannot corrupt the cache.
+# Each entry is (value, json_safe), where json_safe records whether the fast orjson copy is exact for it.
+YAML_CACHE_MAX = int(os.environ.get('YAML_CACHE_MAX', 100))
+# Guards all caches below; they are shared by request threads and reference-scan workers
+_cache_lock = threading.Lock()
+# Interpolated (reference-free) parses keyed by a BLAKE2b-128 digest of the raw text; shared by /parse and
+# by every file parsed during reference resolution (the frontend often resubmits identical content)
+_parse_cache: "OrderedDict[bytes, Tuple[Dict[str, Any], bool]]" = OrderedDict()
+# Keyed by (gcs_blob_name, generation, size) so a changed blob never hits a stale entry
+_file_cache: "OrderedDict[Tuple[str, Any, Any], Tuple[Dict[str, Any], bool]]" = OrderedDict()
+# Keyed by URL; entries hold the response validators ('etag', 'last_modified') and the parsed 'config'
+_url_cache: "OrderedDict[str, Tuple[Dict[str, Any], bool]]" = OrderedDict()
+# Raw (unresolved) local YAML used by the reference scan, keyed by (realpath, mtime_ns, size)
+_local_yaml_cache: "OrderedDict[Tuple[str, int, int], Tuple[Dict[str, Any], bool]]" = OrderedDict()
+# Fully processed configs keyed by (upload_id, normalized relative_path). Upload contents never change
+# under an upload_id, so hits skip even the GCS metadata call; entries are dropped on cleanup-upload.
+_upload_cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], bool]]" = OrderedDict()
+# Raw text of upload blobs whose bytes the server already held when they were uploaded, keyed by GCS blob name.
+# Lets reference resolution skip the exists() + download round trips for files it just uploaded.
+PRIMED_TEXT_MAX = int(os.environ.get('PRIMED_TEXT_MAX', 1000))
+_primed_text: "OrderedDict[str, str]" = OrderedDict()
+
+# Names of the blobs under each upload or preset session's prefix, listed once (names only) the first time
+# primed texts cannot answer an existence check. Upload contents never change, so entries live until cleanup.
+_upload_blob_names: "OrderedDict[str, frozenset]" = OrderedDict()
+
+def _json_round_trips(value: Any) -> bool:
+    """
+    True if an orjson round-trip reproduces value exactly. orjson writes NaN/Infinity as null, dates and
+    times as ISO strings and tuples as lists, so trees holding any of those (e.g. YAML `.nan` or a bare
+    date) must be deep-copied instead. Types orjson rejects outright make it raise, which is handled separately.
+    """
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, float):
+            if not math.isfinite(node):
+                return False
+        elif isinstance(node, (datetime.date, datetime.time, tuple)):
+            return False
+    return True
+
+def _fast_copy(value: Any, json_safe: Optional[bool] = None) -> Any:
+    """
+    Deep-copies a parsed YAML tree. JSON-safe trees (see _json_round_trips) go through an orjson round-trip,
+    which runs in C and is far cheaper than copy.deepcopy; anything else (including trees orjson rejects,
+    e.g. non-str keys) is copied with copy.deepcopy, so the copy always equals the original.
+
+    Args:
+        json_safe: The result of _json_round_trips(value), if already known.
+    """
+    if orjson is not None:
+        if json_safe is None:
+            json_safe = _json_round_trips(value)
+        if json_safe:
+            try:
+                return orjson.loads(orjson.dumps(value))
+            except TypeError:
+                pass
+    return copy.deepcopy(value)
+
+def _cache_get(cache: OrderedDict, key: Any) -> Optional[Dict[str, Any]]:
+    """Returns a deep copy of a cached entry (marking it recently used), or None on a miss."""
+    with _cache_lock:
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        cache.move_to_end(key)
+    value, json_safe = cached
+    return _fast_copy(value, json_safe)
+
+def _cache_has(cache: OrderedDict, key: Any) -> bool:
+    """True if key is cached, without copying the entry or refreshing its recency."""
+    with _cache_lock:
+        return key in cache
+
+def _cache_put(cache: OrderedDict, key: Any, value: Dict[str, Any]):
+    """Stores a deep copy of value, evicting the least recently used entry when full."""
+    json_safe = _json_round_trips(value)
+    entry = (_fast_copy(value, json_safe), json_safe)
+    with _cache_lock:
+        cache[key] = entry
+        cache.move_to_end(key)
+        while len(cache) > YAML_CACHE_MAX:
+            cache.popitem(last=False)
+
+def prime_upload_texts(upload_id: str, texts: Dict[str, str]):
+    """Records the text of files just uploaded under upload_id (keyed by relative path) so resolution needn't re-download them."""
+    with _cache_lock:
+        for relative_path, text in texts.items():
+            blob_name = f"{upload_gcs_prefix(upload_id)}{os.path.normpath(relative_path)}"
+            _primed_text[blob_name] = text
+            _primed_text.move_to_end(blob_name)
+        while len(_primed_text) > PRIMED_TEXT_MAX:
+            _primed_text.popitem(last=False)
+
+def _get_primed_text(blob_name: str) -> Optional[str]:
+    """Returns the primed text of an upload blob, or None if it was not primed (or has been evicted)."""
+    with _cache_lock:
+        return _primed_text.get(blob_name)
+
+def _upload_blob_exists(upload_id: str, blob_name: str) -> bool:
+    """True if blob_name exists under the upload's prefix, answered from primed texts or the cached prefix listing."""
+    if _get_primed_text(blob_name) is not None:
+        return True
+    with _cache_lock:
+        names = _upload_blob_names.get(upload_id)
+        if names is not None:
+            _upload_blob_names.move_to_end(upload_id)
+    if names is None:
+        # One paginated LIST replaces an exists() HEAD per referenced file
+        names = frozenset(
+            blob.name for blob in storage_client.list_blobs(
+                GCS_BUCKET_NAME, prefix=upload_gcs_prefix(upload_id), fields='items(name),nextPageToken')
+        )
+        with _cache_lock:
+            _upload_blob_names[upload_id] = names
+            while len(_upload_blob_names) > YAML_CACHE_MAX:
+                _upload_blob_names.popitem(last=False)
+    return blob_name in names
+
+def invalidate_upload_cache(upload_id: str) -> int:
+    """Drops every processed config, primed text and blob listing cached for upload_id. Returns the number of entries removed."""
+    blob_prefix = upload_gcs_prefix(upload_id)
+    with _cache_lock:
+        _upload_blob_names.pop(upload_id, None)
+        stale = [key for key in _upload_cache if key[0] == upload_id]
+        for key in stale:
+            del _upload_cache[key]
+        stale_texts = [name for name in _primed_text if name.startswith(blob_prefix)]
+        for name in stale_texts:
+            del _primed_text[name]
+    return len(stale) + len(stale_texts)
+# --- End Parsed YAML Caches ---
+
+# Shared HTTP session for /fetch, so repeat fetches reuse pooled connections
+_http_session = requests.Session()
+
+# Reference scans are I/O-bound (disk reads), so oversubscribe the CPUs
+REFERENCE_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def _shared_yaml_pool() -> Optional[ThreadPoolExecutor]:
+    """Returns the app-wide pool created by create_app, or None outside an app context."""
+    if has_app_context():
+        return getattr(current_app, 'yaml_pool', None)
+    return None
+
+# Documents at least this large are parsed in worker processes, off the GIL; smaller ones
+# parse faster inline than their text and result take to pickle across processes
+PARSE_PROCESS_MIN_BYTES = int(os.environ.get('PARSE_PROCESS_MIN_BYTES', 256 * 1024))
+
+def _shared_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Returns the app-wide parse process pool created by create_app, or None outside an app context."""
+    if has_app_context():
+        return getattr(current_app, 'parse_pool', None)
+    return None
+
+# --- JSON Sidecar Cache ---
+# Configs parsed from local files and URLs are also persisted as JSON under the system temp dir, keyed by
+# source and content MD5, so warm starts can json.load instead of re-running PyYAML. Uploaded files are not
+# sidecarred: their resolved config depends on the rest of the upload, and _file_cache covers repeat requests.
+SIDECAR_DIR = os.path.join(tempfile.gettempdir(), 'yaml_sidecars')
+# Sidecars of the files warm_cache loaded at startup; the age sweep keeps them for the life of the process
+_pinned_sidecars: Set[str] = set()
+
+def _local_sidecar_path(key: str, content: str) -> str:
+    """Returns the local sidecar path for a source key (e.g. a URL) and its content."""
+    key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
+    content_hash = hashlib.md5(content.encode('utf-8')).hexdigest()
+    return os.path.join(SIDECAR_DIR, f"{key_hash}.{content_hash}.json")
+
+def _load_local_sidecar(path: str) -> Optional[Dict[str, Any]]:
+    """Loads a local JSON sidecar, returning None if it does not exist or is unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Failed to read sidecar %s: %s", path, e)
+        return None
+
+def _json_keys_are_str(value: Any) -> bool:
+    """True if every mapping key in value is a str. JSON turns int/bool keys (e.g. YAML `1:` or `yes:`) into strings."""
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if not all(isinstance(key, str) for key in node):
+                return False
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return True
+
+def _write_local_sidecar(path: str, config: Dict[str, Any]):
+    """
+    Atomically writes a local JSON sidecar. Failures are logged and ignored.
+    Configs a JSON round trip would not reproduce exactly are skipped, so a sidecar hit always equals a fresh parse.
+    """
+    if not (_json_round_trips(config) and _json_keys_are_str(config)):
+        return
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SIDECAR_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(config, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning("Failed to write sidecar %s: %s", path, e)
+
+def cleanup_local_sidecars(max_age_seconds: int = 24 * 3600):
+    """Removes local JSON sidecars older than max_age_seconds, except warm_cache's. Safe to call at any time."""
+    if not os.path.isdir(SIDECAR_DIR):
+        return
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(SIDECAR_DIR):
+        path = os.path.join(SIDECAR_DIR, name)
+        if path in _pinned_sidecars:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except Exception as e:
+            logger.warning("Failed to remove stale sidecar %s: %s", path, e)
+# --- End JSON Sidecar Cache ---
+
 # --- GCS Helper Functions ---
-def download_gcs_blob_to_temp(blob_name: str) -> Optional[str]:
-    """Downloads a GCS blob to a local temporary file and returns the path."""
+def download_gcs_blob_text(blob_name: str, blob: Optional[storage.Blob] = None) -> Optional[str]:
+    """
+    Downloads a GCS blob straight into memory and returns its text.
+    Pass the blob from an earlier get_blob to download exactly the generation it describes.
+    Returns None if the blob is missing or the download fails.
+    """
+    primed = _get_primed_text(blob_name)
+    if primed is not None:
+        return primed
     if not gcs_bucket:
-        print("ERROR: GCS bucket not initialized.")
+        logger.error("GCS bucket not initialized.")
         return None
     try:
-        blob = gcs_bucket.blob(blob_name)
-        # Create a temporary file (ensures unique name)
-        _, temp_local_filename = tempfile.mkstemp()
-        blob.download_to_filename(temp_local_filename)
-        print(f"Downloaded gs://{GCS_BUCKET_NAME}/{blob_name} to {temp_local_filename}")
-        return temp_local_filename
+        # Configs are small and parsed right away, so skip the temp-file write/read/unlink round trip
+        content = (blob or gcs_bucket.blob(blob_name)).download_as_bytes()
+        logger.debug("Downloaded gs://%s/%s (%d bytes)", GCS_BUCKET_NAME, blob_name, len(content))
+        return content.decode('utf-8')
     except gcs_exceptions.NotFound:
-        print(f"ERROR: Blob not found in GCS: gs://{GCS_BUCKET_NAME}/{blob_name}")
+        logger.error("Blob not found in GCS: gs://%s/%s", GCS_BUCKET_NAME, blob_name)
         return None # Indicate file not found
     except Exception as e:
-        print(f"ERROR: Failed to download blob {blob_name}: {e}")
+        logger.error("Failed to download blob %s: %s", blob_name, e)
         return None
 
-def cleanup_local_temp_file(file_path: Optional[str]):
-    """Safely removes a local temporary file if it exists."""
-    if file_path and os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-            # print(f"Cleaned up local temp file: {file_path}")
-        except Exception as e:
-            print(f"WARNING: Failed to clean up local temp file {file_path}: {e}")
+def _download_blob_texts(blob_names: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Downloads the text of several blobs (see download_gcs_blob_text), concurrently on the app-wide pool.
+    Primed blobs need no download, and outside an app context the downloads run one after another.
+    """
+    texts = {name: _get_primed_text(name) for name in blob_names}
+    pending = [name for name, text in texts.items() if text is None]
+    executor = _shared_yaml_pool()
+    if executor is None or len(pending) < 2:
+        texts.update((name, download_gcs_blob_text(name)) for name in pending)
+    else:
+        texts.update(zip(pending, executor.map(download_gcs_blob_text, pending)))
+    return texts
 
 # --- Modified Service Functions ---
 
 # Modified signature: accepts upload_id instead of root_temp_dir
 # base_path is now the relative directory *within* the GCS upload prefix
-def parse_yaml_content(content: str, upload_id: Optional[str] = None, base_path: str = '') -> Dict[str, Any]:
+def parse_yaml_content(content: Union[str, bytes], upload_id: Optional[str] = None, base_path: str = '',
+                       ancestors: FrozenSet[str] = frozenset(), cycle_cuts: Optional[Set[str]] = None) -> Dict[str, Any]:
     """
     Parse YAML content, resolve interpolations, and resolve config references using GCS context.
 
     Args:
-        content: YAML content as a string.
+        content: YAML content as a string or UTF-8 bytes.
         upload_id: The unique ID for the GCS upload context.
         base_path: The relative directory path within the GCS upload prefix for resolving relative references.
+        ancestors: See resolve_config_references.
+        cycle_cuts: See resolve_config_references.
 
     Returns:
         Parsed YAML configuration with resolved interpolations and config references.
     """
     try:
-        # Parse the YAML content using OmegaConf
-        config = OmegaConf.create(yaml.safe_load(content))
-        # Resolve interpolation expressions first
-        resolved_config = OmegaConf.to_container(config, resolve=True)
+        # Parse and resolve interpolations (memoized by content; references depend on context and are not)
+        resolved_config = _parse_and_interpolate(content)
     except Exception as e:
-        print(f"Error parsing initial YAML content: {e}")
+        logger.warning("Error parsing initial YAML content: %s", e)
         return {'error': f"Invalid YAML content: {e}"}
 
     # Resolve config references using GCS context
     try:
-        return resolve_config_references(resolved_config, upload_id=upload_id, base_path=base_path)
+        return resolve_config_references(resolved_config, upload_id=upload_id, base_path=base_path, ancestors=ancestors,
+                                         cycle_cuts=cycle_cuts)
     except Exception as e:
-        print(f"Error resolving config references: {e}")
+        logger.exception("Error resolving config references")
         # Return the partially resolved config but add an error marker
         resolved_config['_processing_error'] = f"Error resolving references: {e}"
         return resolved_config
 
 
+def _parse_and_interpolate(content: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    Load YAML and resolve its OmegaConf interpolations, reusing the result for identical content.
+    Raises on invalid YAML or interpolations; failures are not cached.
+
+    Returns:
+        The interpolated configuration, owned by the caller (the cache keeps its own copy).
+    """
+    # Encode once: the digest, the interpolation scan and libyaml all work on the UTF-8 bytes
+    # (given a str, the C loader would otherwise make its own UTF-8 copy)
+    raw = content.encode('utf-8') if isinstance(content, str) else content
+    key = _parse_cache_key(raw)
+    cached = _cache_get(_parse_cache, key)
+    if cached is not None:
+        return cached
+    pool = _shared_parse_pool() if len(raw) >= PARSE_PROCESS_MIN_BYTES else None
+    if pool is not None:
+        config = pool.submit(_load_and_interpolate, raw).result()
+    else:
+        config = _load_and_interpolate(raw)
+    _cache_put(_parse_cache, key, config)
+    return config
+
+
+def _parse_cache_key(raw: bytes) -> bytes:
+    """Returns the _parse_cache key for UTF-8 YAML content."""
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def _load_and_interpolate(raw: bytes) -> Dict[str, Any]:
+    """Uncached YAML load and interpolation of UTF-8 bytes; a top-level function so the parse process pool can run it."""
+    config = yaml.load(raw, Loader=SafeLoader)
+    # Most files have no interpolations, and to_container is the slow part of OmegaConf; skip it for plain
+    # mappings. Anything else still goes through OmegaConf, so its validation errors are unchanged
+    if isinstance(config, dict):
+        if raw.find(b'${') == -1:
+            return config
+        # Plain key references are substituted directly, without building a DictConfig
+        if _resolve_simple_interpolations(config):
+            return config
+    return OmegaConf.to_container(OmegaConf.create(config), resolve=True)
+
+
+# An absolute key reference such as ${model.width}. Resolvers (${oc.env:X}), relative keys (${.x}),
+# nested and escaped interpolations are all left to OmegaConf
+_SIMPLE_INTERP_RE = re.compile(r'\$\{([A-Za-z_][\w-]*(?:\.[A-Za-z_][\w-]*)*)\}')
+
+# Non-string values OmegaConf accepts as-is (bool is an int subclass)
+_OMEGACONF_SCALARS = (int, float, type(None))
+
+
+def _resolve_simple_interpolations(config: Dict[str, Any]) -> bool:
+    """
+    Substitute ${key.path} interpolations in string values in place, as OmegaConf would resolve them.
+
+    Only handles references to scalar values that contain no interpolation themselves, in configs holding
+    nothing OmegaConf would reject. Otherwise nothing is modified.
+
+    Returns:
+        True if every interpolation was substituted, False if OmegaConf must resolve the config instead.
+    """
+    substitutions = []
+    stack = [config]
+    while stack:
+        node = stack.pop()
+        for key, value in (node.items() if isinstance(node, dict) else enumerate(node)):
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+                continue
+            if not isinstance(value, str):
+                if not isinstance(value, _OMEGACONF_SCALARS): # e.g. YAML dates, which OmegaConf rejects
+                    return False
+                continue
+            if '${' not in value:
+                continue
+            matches = list(_SIMPLE_INTERP_RE.finditer(value))
+            if len(matches) != value.count('${') or '\\${' in value:
+                return False
+            targets = []
+            for match in matches:
+                target = config
+                for part in match.group(1).split('.'):
+                    if not isinstance(target, dict) or part not in target:
+                        return False
+                    target = target[part]
+                if isinstance(target, str):
+                    if '${' in target or target == '???': # Chained interpolation, or OmegaConf's missing value
+                        return False
+                elif not isinstance(target, _OMEGACONF_SCALARS):
+                    return False
+                targets.append(target)
+            if len(matches) == 1 and matches[0].group(0) == value:
+                substitutions.append((node, key, targets[0])) # A whole-value reference keeps the target's type
+            else:
+                parts = iter(str(target) for target in targets)
+                substitutions.append((node, key, _SIMPLE_INTERP_RE.sub(lambda _: next(parts), value)))
+    for node, key, value in substitutions:
+        node[key] = value
+    return True
+
+
+def parse_yaml_content_cached(content: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    Parse YAML content without GCS context, reusing a cached result for identical content.
+
+    Args:
+        content: YAML content as a string or UTF-8 bytes.
+
+    Returns:
+        A deep copy of the parsed configuration, so callers may mutate it freely.
+    """
+    # Without an upload context there are no references to resolve, so the content-keyed parse is the whole result
+    return parse_yaml_content(content)
+
+
+def warm_cache(file_paths: List[str]) -> int:
+    """
+    Parse local YAML files into the content cache so that /parse requests for them hit immediately.
+    Results are also kept as local JSON sidecars, so later processes load them without parsing; the
+    periodic sidecar sweep leaves these in place.
+
+    Args:
+        file_paths: Paths of YAML files to pre-parse.
+
+    Returns:
+        Number of files successfully cached.
+    """
+    warmed = 0
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'r') as f:
+                content = f.read()
+            # A sidecar for this exact file and content lets a restart skip PyYAML for unchanged configs
+            sidecar_path = _local_sidecar_path(os.path.realpath(file_path), content)
+            _pinned_sidecars.add(sidecar_path)
+            config = _load_local_sidecar(sidecar_path)
+            if config is not None:
+                _cache_put(_parse_cache, _parse_cache_key(content.encode('utf-8')), config)
+            else:
+                config = parse_yaml_content_cached(content)
+                if 'error' not in config and '_processing_error' not in config:
+                    _write_local_sidecar(sidecar_path, config)
+            warmed += 1
+        except Exception as e:
+            logger.warning("Failed to warm cache with %s: %s", file_path, e)
+    return warmed
+
+
+def _iter_ref_modules(config: Any) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    """
+    Yield (module_name, module_data, config_path) for every module whose config is a file reference
+    (a string). The 'input' and 'output' pseudo-modules are skipped.
+    """
+    modules = config.get('modules') if isinstance(config, dict) else None
+    if not isinstance(modules, dict):
+        return
+    for module_name, module_data in modules.items():
+        if module_name in ('input', 'output'): continue
+        if isinstance(module_data, dict):
+            config_path = module_data.get('config')
+            if isinstance(config_path, str):
+                yield module_name, module_data, config_path
+
+
 # find_config_references and find_all_config_references are problematic with GCS
 # without downloading everything first. They are less critical for the core processing logic
 # which now resolves references on demand via GCS.
 # Keep them for now but note their limitations in a GCS context.
-def find_config_references(config: Dict[str, Any], base_path: str = '') -> List[Tuple[str, str]]:
+def find_config_references(config: Dict[str, Any], base_path: str = '', dir_cache: Optional[Dict[str, Optional[frozenset]]] = None) -> List[Tuple[str, str]]:
     """
     Find all config fields that are strings pointing to YAML files (based on local paths).
     NOTE: This function operates on the assumption of local paths and may not accurately
           reflect GCS structure without adaptation or prior download of all files.
+
+    Existence is answered from one os.scandir listing per directory, memoized in dir_cache; pass one
+    dict for a whole scan so every file referencing the same directory shares the listing.
     """
     references = []
-    if not config or 'modules' not in config:
-        return references
-    modules = config['modules']
-    for module_name, module_data in modules.items():
-        if module_name in ['input', 'output']: continue
-        if isinstance(module_data, dict) and 'config' in module_data and isinstance(module_data['config'], str):
-            config_path_str = module_data['config']
-            # This resolution logic is local-filesystem based
-            resolved_path = config_path_str
-            if not config_path_str.startswith('/'):
-                possible_paths = [os.path.join(base_path, config_path_str), config_path_str]
-                for path in possible_paths:
-                    if os.path.exists(path): # Checks local filesystem only
-                        resolved_path = path
-                        references.append((module_name, resolved_path))
-                        break
-            elif os.path.exists(resolved_path):
-                 references.append((module_name, resolved_path))
+    if dir_cache is None:
+        dir_cache = {}
+
+    def path_exists(path):
+        directory, name = os.path.split(path)
+        entries = dir_cache.get(directory, False)
+        if entries is False:
+            try:
+                with os.scandir(directory or '.') as it:
+                    entries = frozenset(entry.name for entry in it)
+            except FileNotFoundError:
+                entries = frozenset()
+            except OSError: # e.g. a directory that can be traversed but not listed
+                entries = None
+            dir_cache[directory] = entries
+        if entries is None or not name:
+            return os.path.exists(path)
+        return name in entries
+
+    for module_name, _, config_path_str in _iter_ref_modules(config):
+        # This resolution logic is local-filesystem based
+        resolved_path = config_path_str
+        if not config_path_str.startswith('/'):
+            possible_paths = [os.path.join(base_path, config_path_str), config_path_str]
+            for path in possible_paths:
+                if path_exists(path): # Checks local filesystem only
+                    resolved_path = path
+                    references.append((module_name, resolved_path))
+                    break
+        elif path_exists(resolved_path):
+             references.append((module_name, resolved_path))
     return references
 
+def iter_all_config_references(content: str, base_path: str = '', root_path: Optional[str] = None) -> Iterator[str]:
+    """
+    Lazily yield all YAML files referenced from in-memory YAML content (based on local paths).
+    Traverses breadth-first, one level at a time, parsing every file of a level in parallel.
+
+    Args:
+        content: YAML content as a string.
+        base_path: Local directory used to resolve relative references.
+        root_path: Path of the file the content came from, if any; it is never yielded.
+
+    Yields:
+        Referenced file paths, each at most once.
+    """
+    config = yaml.load(content, Loader=SafeLoader)
+    # Visited nodes are keyed by canonical path so symlinks and relative spellings collapse to one node
+    visited = {os.path.realpath(root_path)} if root_path else set()
+    # Each candidate directory is listed at most once per scan
+    dir_cache = {}
+    frontier = [ref_path for _, ref_path in find_config_references(config, base_path, dir_cache)] # Uses local path logic
+    # Reuse the app-wide pool when serving a request; only standalone callers pay for a private one
+    executor = _shared_yaml_pool()
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=REFERENCE_SCAN_WORKERS)
+    try:
+        while frontier:
+            level = []
+            for ref_path in frontier:
+                canonical_path = os.path.realpath(ref_path)
+                if canonical_path in visited: continue
+                visited.add(canonical_path)
+                level.append(ref_path)
+                yield ref_path
+            # Each file is parsed at most once per scan (and at most once per mtime across scans)
+            futures = [executor.submit(_local_config_references, ref_path, dir_cache) for ref_path in level]
+            frontier = []
+            for ref_path, future in zip(level, futures):
+                try:
+                    frontier.extend(future.result())
+                except FileNotFoundError: logger.warning("Referenced file not found locally during recursive search: %s", ref_path)
+                except Exception as e: logger.error("Error finding references locally in %s: %s", ref_path, e)
+    finally:
+        if owns_executor:
+            executor.shutdown(wait=False)
+
+def find_all_config_references_in_content(content: str, base_path: str = '', root_path: Optional[str] = None) -> List[str]:
+    """
+    Find all YAML files referenced from in-memory YAML content (based on local paths).
+    Lets callers scan an uploaded stream without first writing it to disk.
+    See iter_all_config_references for the arguments.
+    """
+    return list(iter_all_config_references(content, base_path, root_path))
+
+def _local_config_references(file_path: str, dir_cache: Optional[Dict[str, Optional[frozenset]]] = None) -> List[str]:
+    """Returns the paths directly referenced by a local YAML file, using the mtime-keyed cache."""
+    st = os.stat(file_path)
+    cache_key = (os.path.realpath(file_path), st.st_mtime_ns, st.st_size)
+    config = _cache_get(_local_yaml_cache, cache_key)
+    if config is None:
+        with open(file_path, 'r') as f:
+            config = yaml.load(f.read(), Loader=SafeLoader)
+        if isinstance(config, dict):
+            _cache_put(_local_yaml_cache, cache_key, config)
+    return [ref_path for _, ref_path in find_config_references(config, os.path.dirname(file_path), dir_cache)]
+
 def find_all_config_references(file_path: str) -> List[str]:
     """
     Recursively find all YAML files referenced (based on local paths).
@@ -127,35 +670,89 @@ def find_all_config_references(file_path: str) -> List[str]:
           reflect GCS structure without adaptation or prior download of all files.
     """
     base_path = os.path.dirname(file_path)
-    print(f"Finding all config references locally in: {file_path}")
+    logger.debug("Finding all config references locally in: %s", file_path)
     try:
         with open(file_path, 'r') as f: content = f.read()
-        config = yaml.safe_load(content)
-        references = find_config_references(config, base_path) # Uses local path logic
-        all_references = [file_path]
-        processed_paths = {file_path}
-        queue = [ref_path for _, ref_path in references]
-        while queue:
-            current_ref_path = queue.pop(0)
-            if current_ref_path in processed_paths: continue
-            processed_paths.add(current_ref_path)
-            if current_ref_path not in all_references: all_references.append(current_ref_path)
-            try:
-                # Recursive call assumes local file exists
-                nested_references = find_all_config_references(current_ref_path)
-                for nested_ref in nested_references:
-                    if nested_ref not in processed_paths and nested_ref not in queue:
-                        queue.append(nested_ref)
-            except FileNotFoundError: print(f"Warning: Referenced file not found locally during recursive search: {current_ref_path}")
-            except Exception as e: print(f"Error finding references locally in {current_ref_path}: {e}")
-        return all_references
-    except FileNotFoundError: print(f"Error: Initial file not found locally in find_all_config_references: {file_path}"); return [file_path]
-    except Exception as e: print(f"Error reading/parsing initial file {file_path} locally in find_all_config_references: {e}"); return [file_path]
+        return [file_path] + find_all_config_references_in_content(content, base_path, root_path=file_path)
+    except FileNotFoundError: logger.error("Initial file not found locally in find_all_config_references: %s", file_path); return [file_path]
+    except Exception as e: logger.error("Error reading/parsing initial file %s locally in find_all_config_references: %s", file_path, e); return [file_path]
+
+
+def find_zip_config_references(zip_ref: zipfile.ZipFile, main_member: str) -> List[str]:
+    """
+    Find the zip members transitively referenced by a main YAML member, reading them from the archive
+    without extracting anything. Members are interpolated before their references are read, and references
+    resolve as in resolve_config_references: relative to the referencing file, or to the archive root when
+    they start with '/'.
+
+    Args:
+        zip_ref: Open zip archive.
+        main_member: Archive name of the main YAML file.
+
+    Returns:
+        Member names, starting with main_member, in discovery order. Missing references are skipped.
+    """
+    members = set(zip_ref.namelist())
+    found = [main_member]
+    found_set = {main_member} # O(1) membership; found itself keeps discovery order
+    # found grows while it is iterated, giving a breadth-first walk without a separate queue
+    for member in found:
+        try:
+            # Interpolated like any parsed file, so references such as `${dir}/a.yaml` are found (and the
+            # parse is cached for when the member is resolved after upload)
+            config = _parse_and_interpolate(zip_ref.read(member))
+        except Exception as e:
+            logger.warning("Could not parse zip member %s while collecting references: %s", member, e)
+            continue
+        for _, _, ref_path in _iter_ref_modules(config):
+            if ref_path.startswith('/'):
+                ref_member = posixpath.normpath(ref_path.lstrip('/'))
+            else:
+                ref_member = posixpath.normpath(posixpath.join(posixpath.dirname(member), ref_path))
+            if ref_member in members and ref_member not in found_set:
+                found_set.add(ref_member)
+                found.append(ref_member)
+    return found
+
+
+def _resolve_reference_file(upload_id: str, normalized_ref_path: str, gcs_blob_name: str, ref_content: Optional[str],
+                            ancestors: FrozenSet[str] = frozenset(), cycle_cuts: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Parse a referenced file and resolve its own references, caching the result in _upload_cache.
+    The cache is shared with process_yaml_file, so a result is only cached when it resolves exactly as
+    process_yaml_file would: not when a cycle back to one of the ancestors cut its subtree short.
+
+    Args:
+        ref_content: The prefetched text, or None to download it here.
+        cycle_cuts: See resolve_config_references.
+
+    Raises:
+        FileNotFoundError: If the blob could not be downloaded.
+    """
+    if ref_content is None: # Download failed, or the cache entry was evicted after the prefetch
+        ref_content = download_gcs_blob_text(gcs_blob_name)
+    if ref_content is None:
+        raise FileNotFoundError(f"Failed to download {gcs_blob_name} from GCS.")
+
+    # Recursively parse the content of the referenced file
+    # Pass the *same* upload_id and the *new* base_path (relative dir of the referenced file)
+    ref_base_path = os.path.dirname(normalized_ref_path)
+    subtree_cuts = set()
+    parsed_ref_config = parse_yaml_content(ref_content, upload_id=upload_id, base_path=ref_base_path,
+                                           ancestors=ancestors | {normalized_ref_path}, cycle_cuts=subtree_cuts)
+    # Cycles back to this file are cut the same way from any caller; cuts further up depend on the caller's path
+    subtree_cuts.discard(normalized_ref_path)
+    if 'error' not in parsed_ref_config and not subtree_cuts:
+        _cache_put(_upload_cache, (upload_id, normalized_ref_path), parsed_ref_config)
+    if cycle_cuts is not None:
+        cycle_cuts.update(subtree_cuts)
+    return parsed_ref_config
 
 
 # Modified signature: accepts upload_id instead of root_temp_dir
 # base_path is the relative directory *within* the GCS upload prefix
-def resolve_config_references(config: Dict[str, Any], upload_id: Optional[str], base_path: str = '') -> Dict[str, Any]:
+def resolve_config_references(config: Dict[str, Any], upload_id: Optional[str], base_path: str = '',
+                              ancestors: FrozenSet[str] = frozenset(), cycle_cuts: Optional[Set[str]] = None) -> Dict[str, Any]:
     """
     Resolve config fields pointing to YAML files by downloading from GCS.
 
@@ -163,97 +760,121 @@ def resolve_config_references(config: Dict[str, Any], upload_id: Optional[str],
         config: The parsed YAML configuration.
         upload_id: The unique ID for the GCS upload context.
         base_path: The relative directory path within the GCS upload prefix for the *current* file being processed.
+        ancestors: Normalized paths of the files being resolved above this one (including the current file).
+            A reference back to one of them is a cycle and keeps its original path.
+        cycle_cuts: If given, collects the ancestor paths at which a cycle was cut anywhere in this subtree.
 
     Returns:
         Configuration with resolved config fields (or error markers).
     """
-    if not config or 'modules' not in config or not upload_id or not gcs_bucket:
-        return config # Cannot resolve without context or GCS
+    # Nothing to resolve without modules; cannot resolve without context or GCS
+    modules = config.get('modules') if isinstance(config, dict) else None
+    if not modules or not upload_id or not gcs_bucket:
+        return config
 
-    modules = config['modules']
-    gcs_upload_prefix = f"uploads/{upload_id}/"
+    gcs_upload_prefix = upload_gcs_prefix(upload_id)
 
-    for module_name, module_data in modules.items():
-        if module_name in ['input', 'output']: continue
-
-        if isinstance(module_data, dict) and 'config' in module_data and isinstance(module_data['config'], str):
-            original_config_path_str = module_data['config'] # This is the relative path string from the YAML
-
-            # --- GCS Path Resolution ---
-            # Assume relative paths are relative to the *current file's* directory within the GCS prefix
-            if not original_config_path_str.startswith('/'):
-                 # Normalize path separators and combine with base_path
-                 normalized_ref_path = os.path.normpath(os.path.join(base_path, original_config_path_str))
-                 # Construct the full GCS blob name
-                 gcs_blob_name = f"{gcs_upload_prefix}{normalized_ref_path}"
+    # First pass: map every file reference to its GCS blob, so existence and downloads can be settled up front
+    references = []
+    for module_name, module_data, original_config_path_str in _iter_ref_modules(config):
+        # original_config_path_str is the relative path string from the YAML
+        # --- GCS Path Resolution ---
+        # Assume relative paths are relative to the *current file's* directory within the GCS prefix
+        if not original_config_path_str.startswith('/'):
+             # Normalize path separators and combine with base_path
+             normalized_ref_path = os.path.normpath(os.path.join(base_path, original_config_path_str))
+             # Construct the full GCS blob name
+             gcs_blob_name = f"{gcs_upload_prefix}{normalized_ref_path}"
+        else:
+             # If it's an absolute path in the YAML, treat it as relative to the *root* of the upload prefix
+             normalized_ref_path = os.path.normpath(original_config_path_str.lstrip('/'))
+             gcs_blob_name = f"{gcs_upload_prefix}{normalized_ref_path}"
+        # --- End GCS Path Resolution ---
+
+        logger.debug("Module %s: Resolving '%s' relative to '%s' -> GCS blob: %s", module_name, original_config_path_str, base_path, gcs_blob_name)
+        references.append((module_name, module_data, original_config_path_str, normalized_ref_path, gcs_blob_name))
+
+    # One existence answer per distinct blob, from primed texts or the upload's one-time listing (no HEAD per module)
+    blob_exists = {name: _upload_blob_exists(upload_id, name) for name in {ref[4] for ref in references}}
+    # Download every file that will be parsed concurrently, instead of one round trip after another.
+    # Files already resolved in this session (by another module, file or request) are reused instead
+    pending = list(dict.fromkeys(
+        (ref[3], ref[4]) for ref in references
+        if blob_exists[ref[4]] and ref[1].get('cls') != 'ComposableModel' and ref[3] not in ancestors
+        and not _cache_has(_upload_cache, (upload_id, ref[3]))
+    ))
+    ref_texts = _download_blob_texts([gcs_blob_name for _, gcs_blob_name in pending])
+
+    # Distinct files still to resolve are parsed (with their subtrees) concurrently on the app-wide pool.
+    # Pool threads have no app context, so nested references inside a worker resolve serially and never
+    # wait on the pool they run on
+    executor = _shared_yaml_pool()
+    ref_futures = {}
+    if executor is not None and len(pending) > 1:
+        ref_futures = {
+            normalized_ref_path: executor.submit(_resolve_reference_file, upload_id, normalized_ref_path, gcs_blob_name,
+                                                 ref_texts.get(gcs_blob_name), ancestors, cycle_cuts)
+            for normalized_ref_path, gcs_blob_name in pending
+        }
+
+    # Second pass: assign results in module order
+    for module_name, module_data, original_config_path_str, normalized_ref_path, gcs_blob_name in references:
+        found_in_gcs = blob_exists[gcs_blob_name]
+
+        is_composable = module_data.get('cls') == 'ComposableModel'
+
+        if is_composable:
+            logger.debug("Module %s is ComposableModel. Keeping original config path: %s", module_name, original_config_path_str)
+            
+            # Store the normalized path instead of the original path
+            # This ensures that when the frontend tries to expand the node,
+            # the backend can find the file correctly
+            if found_in_gcs:
+                # Store the normalized path that will work with the get-subgraph endpoint
+                module_data['config'] = normalized_ref_path
+                module_data['_resolved_config_path'] = f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Store GCS path
+                logger.debug("Stored normalized path for ComposableModel %s: %s", module_name, normalized_ref_path)
             else:
-                 # If it's an absolute path in the YAML, treat it as relative to the *root* of the upload prefix
-                 normalized_ref_path = os.path.normpath(original_config_path_str.lstrip('/'))
-                 gcs_blob_name = f"{gcs_upload_prefix}{normalized_ref_path}"
-
-            print(f"Module {module_name}: Resolving '{original_config_path_str}' relative to '{base_path}' -> GCS blob: {gcs_blob_name}")
-
-            # Check if the blob exists in GCS
-            blob = gcs_bucket.blob(gcs_blob_name)
-            found_in_gcs = blob.exists()
-            # --- End GCS Path Resolution ---
-
-            is_composable = module_data.get('cls') == 'ComposableModel'
-
-            if is_composable:
-                print(f"Module {module_name} is ComposableModel. Keeping original config path: {original_config_path_str}")
-                
-                # Store the normalized path instead of the original path
-                # This ensures that when the frontend tries to expand the node,
-                # the backend can find the file correctly
-                if found_in_gcs:
-                    # Store the normalized path that will work with the get-subgraph endpoint
-                    module_data['config'] = normalized_ref_path
-                    module_data['_resolved_config_path'] = f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Store GCS path
-                    print(f"Stored normalized path for ComposableModel {module_name}: {normalized_ref_path}")
-                else:
-                    # Keep the original path if the file wasn't found
-                    module_data['config'] = original_config_path_str
-                    print(f"Warning: Config path '{original_config_path_str}' (-> {gcs_blob_name}) for ComposableModel {module_name} not found in GCS.")
-                
-                continue # Skip download/parsing for ComposableModel
-
-            # --- If not ComposableModel, attempt download and parse ---
-            if not found_in_gcs:
-                print(f"Warning: Config file '{original_config_path_str}' (-> {gcs_blob_name}) not found in GCS upload context {upload_id}. Keeping original path.")
-                # Keep the original path string instead of setting an error
+                # Keep the original path if the file wasn't found
                 module_data['config'] = original_config_path_str
-                continue
-
-            # File found in GCS, download and process
-            local_temp_path = None
-            try:
-                local_temp_path = download_gcs_blob_to_temp(gcs_blob_name)
-                if not local_temp_path: # Download failed
-                    raise FileNotFoundError(f"Failed to download {gcs_blob_name} from GCS.")
-
-                with open(local_temp_path, 'r') as f:
-                    ref_content = f.read()
-
-                # Recursively parse the content of the referenced file
-                # Pass the *same* upload_id and the *new* base_path (relative dir of the referenced file)
-                ref_base_path = os.path.dirname(normalized_ref_path)
-                parsed_ref_config = parse_yaml_content(ref_content, upload_id=upload_id, base_path=ref_base_path)
+                logger.warning("Config path '%s' (-> %s) for ComposableModel %s not found in GCS.", original_config_path_str, gcs_blob_name, module_name)
+            
+            continue # Skip download/parsing for ComposableModel
+
+        # --- If not ComposableModel, parse the downloaded content ---
+        if not found_in_gcs:
+            logger.warning("Config file '%s' (-> %s) not found in GCS upload context %s. Keeping original path.", original_config_path_str, gcs_blob_name, upload_id)
+            # Keep the original path string instead of setting an error
+            module_data['config'] = original_config_path_str
+            continue
+
+        if normalized_ref_path in ancestors:
+            logger.warning("Config reference '%s' (-> %s) is cyclic. Keeping original path.", original_config_path_str, gcs_blob_name)
+            module_data['config'] = original_config_path_str
+            if cycle_cuts is not None:
+                cycle_cuts.add(normalized_ref_path)
+            continue
+
+        # File found in GCS, process its prefetched text
+        try:
+            # A file shared by several modules is resolved once; later modules get their own copy from the cache
+            future = ref_futures.pop(normalized_ref_path, None)
+            if future is not None:
+                parsed_ref_config = future.result()
+            else:
+                parsed_ref_config = _cache_get(_upload_cache, (upload_id, normalized_ref_path))
+                if parsed_ref_config is None:
+                    parsed_ref_config = _resolve_reference_file(upload_id, normalized_ref_path, gcs_blob_name,
+                                                                ref_texts.get(gcs_blob_name), ancestors, cycle_cuts)
 
-                # Replace the string reference with the parsed content
-                module_data['config'] = parsed_ref_config
-                module_data['_resolved_config_path'] = f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Store GCS path
+            # Replace the string reference with the parsed content
+            module_data['config'] = parsed_ref_config
+            module_data['_resolved_config_path'] = f"gs://{GCS_BUCKET_NAME}/{gcs_blob_name}" # Store GCS path
 
-            except Exception as e:
-                error_msg = f"Error reading/parsing config reference '{original_config_path_str}' (from GCS: {gcs_blob_name}): {e}"
-                tb_str = traceback.format_exc()
-                print(f"{error_msg}\n{tb_str}")
-                # Keep the original path string instead of setting an error
-                print(f"Warning: Error processing config file '{original_config_path_str}'. Keeping original path.")
-                module_data['config'] = original_config_path_str
-            finally:
-                # Clean up the temporary local file used for this reference
-                cleanup_local_temp_file(local_temp_path)
+        except Exception:
+            logger.exception("Error reading/parsing config reference '%s' (from GCS: %s). Keeping original path.", original_config_path_str, gcs_blob_name)
+            # Keep the original path string instead of setting an error
+            module_data['config'] = original_config_path_str
 
     return config
 
@@ -265,7 +886,7 @@ def process_yaml_file(upload_id: str, relative_path: str) -> Dict[str, Any]:
     parse it, and resolve its config references within the GCS context.
 
     Args:
-        upload_id: The unique ID for the GCS upload context.
+        upload_id: The unique ID for the GCS upload context, or a preset session ID (see upload_gcs_prefix).
         relative_path: The relative path of the YAML file within the GCS upload prefix.
 
     Returns:
@@ -274,34 +895,46 @@ def process_yaml_file(upload_id: str, relative_path: str) -> Dict[str, Any]:
     if not gcs_bucket:
         return {'error': "GCS not configured on server", 'errorType': 'SERVER_ERROR'}
 
-    gcs_blob_name = f"uploads/{upload_id}/{os.path.normpath(relative_path)}"
-    local_temp_path = None
+    gcs_blob_name = f"{upload_gcs_prefix(upload_id)}{os.path.normpath(relative_path)}"
+    upload_key = (upload_id, os.path.normpath(relative_path))
+    cached = _cache_get(_upload_cache, upload_key)
+    if cached is not None:
+        return cached
 
     try:
-        local_temp_path = download_gcs_blob_to_temp(gcs_blob_name)
-        if not local_temp_path:
+        # Files primed at upload time (the main file's reference closure) are parsed without any GCS call.
+        # Otherwise check the file cache using the blob's generation and size (one metadata call, no download)
+        cache_key = None
+        primed = _get_primed_text(gcs_blob_name)
+        blob = gcs_bucket.get_blob(gcs_blob_name) if primed is None else None
+        if blob is not None:
+            cache_key = (gcs_blob_name, blob.generation, blob.size)
+            cached = _cache_get(_file_cache, cache_key)
+            if cached is not None:
+                _cache_put(_upload_cache, upload_key, cached)
+                return cached
+
+        content = primed if primed is not None else download_gcs_blob_text(gcs_blob_name, blob)
+        if content is None:
             # Return a specific error structure if file not found in GCS
             return {
                 'error': f"File not found in GCS: {relative_path}",
                 'errorType': 'CONFIG_FILE_NOT_FOUND_GCS' # Specific type for route handler
             }
 
-        # Read the content from the local temporary file
-        with open(local_temp_path, 'r') as f:
-            content = f.read()
-
         # Parse the content, passing the upload_id and the relative directory of the file
         base_path = os.path.dirname(relative_path)
-        return parse_yaml_content(content, upload_id=upload_id, base_path=base_path)
+        config = parse_yaml_content(content, upload_id=upload_id, base_path=base_path, ancestors=frozenset({upload_key[1]}))
+        if 'error' not in config:
+            _cache_put(_upload_cache, upload_key, config)
+            if cache_key is not None:
+                _cache_put(_file_cache, cache_key, config)
+        return config
 
     except Exception as e:
         error_msg = f"Error processing YAML file from GCS ({gcs_blob_name}): {e}"
-        tb_str = traceback.format_exc()
-        print(f"{error_msg}\n{tb_str}")
+        logger.exception(error_msg)
         return {'error': error_msg, 'errorType': 'PROCESSING_ERROR'}
-    finally:
-        # Clean up the main temporary local file
-        cleanup_local_temp_file(local_temp_path)
 
 
 def fetch_yaml_file(url: str) -> Dict[str, Any]:
@@ -315,18 +948,43 @@ def fetch_yaml_file(url: str) -> Dict[str, Any]:
         # Get the base path for resolving relative paths (less reliable for URLs)
         base_path = os.path.dirname(url)
 
+        # Revalidate a previous fetch with a conditional GET; a 304 skips both the download and the parse
+        cached = _cache_get(_url_cache, url)
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
         # Fetch the YAML file
-        response = requests.get(url)
+        response = _http_session.get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return cached['config']
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         content = response.text
-
-        # Parse the YAML content - NO upload_id is passed, so references won't be resolved via GCS
-        # This assumes the external file is self-contained or references other public URLs
-        # parse_yaml_content needs to handle upload_id=None gracefully
-        return parse_yaml_content(content, base_path=base_path, upload_id=None)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        # A sidecar for this exact URL and content skips PyYAML entirely
+        sidecar_path = _local_sidecar_path(url, content)
+        config = _load_local_sidecar(sidecar_path)
+        if config is None:
+            # Parse the YAML content - NO upload_id is passed, so references won't be resolved via GCS
+            # This assumes the external file is self-contained or references other public URLs
+            # parse_yaml_content needs to handle upload_id=None gracefully
+            config = parse_yaml_content(content, base_path=base_path, upload_id=None)
+            if 'error' in config:
+                return config
+            if '_processing_error' not in config:
+                _write_local_sidecar(sidecar_path, config)
+
+        if etag or last_modified:
+            _cache_put(_url_cache, url, {'etag': etag, 'last_modified': last_modified, 'config': config})
+        return config
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching URL {url}: {e}")
+        logger.warning("Error fetching URL %s: %s", url, e)
         return {'error': f"Failed to fetch URL: {e}"}
     except Exception as e:
-        print(f"Error processing fetched YAML from {url}: {e}")
+        logger.exception("Error processing fetched YAML from %s", url)
         return {'error': f"Error processing fetched YAML: {e}"}
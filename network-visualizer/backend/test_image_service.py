@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test script for the image service
+
+This script checks the SVG path parsing used by crop_svg against paths whose
+end points are known.
+"""
+
+import os
+import sys
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.image_service import _path_points
+
+def main():
+    """Main entry point for the script."""
+    cases = [
+        # Arc flags separated from the other arguments
+        ("M0 0 a10 10 0 1 1 50 50", [(0.0, 0.0), (50.0, 50.0)]),
+        # Arc flags written without separators: "1150" is the two flags followed by x = 50
+        ("M0 0 a10 10 0 1150 50", [(0.0, 0.0), (50.0, 50.0)]),
+        ("M10 10 A5,5,0,0150,50", [(10.0, 10.0), (50.0, 50.0)]),
+    ]
+
+    failures = 0
+    for path_data, expected in cases:
+        points = _path_points(path_data)
+        if points == expected:
+            print(f"OK   {path_data!r}")
+        else:
+            print(f"FAIL {path_data!r}: expected {expected}, got {points}")
+            failures += 1
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test script for the YAML processor
+
+This script processes small YAML files with yaml_processor and checks that
+the output matches what OmegaConf.load followed by to_container produces.
+"""
+
+import os
+import sys
+import tempfile
+
+import yaml
+from omegaconf import OmegaConf
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.yaml_processor import process_yaml
+
+CASES = {
+    "floats": "lr: 1e-5\nwd: 5E-4\nscale: 1.5\nsteps: 10\nbase_lr: ${lr}\n",
+    "dates": "start: 2021-01-01\nstamp: 2001-12-14t21:59:43.10-05:00\n",
+    "plain": "lr: 1e-5\nstart: 2021-01-01\nname: resnet\n",
+    "empty": "",
+}
+
+def main():
+    """Main entry point for the script."""
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, text in CASES.items():
+            input_file = os.path.join(tmp_dir, f"{name}.yaml")
+            with open(input_file, 'w') as f:
+                f.write(text)
+            expected = yaml.safe_load(yaml.dump(OmegaConf.to_container(OmegaConf.load(input_file), resolve=True)))
+            with open(process_yaml(input_file, os.path.join(tmp_dir, f"{name}.out.yaml"))) as f:
+                processed = yaml.safe_load(f)
+            if processed == expected:
+                print(f"OK   {name}: {processed}")
+            else:
+                print(f"FAIL {name}: expected {expected}, got {processed}")
+                failures += 1
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
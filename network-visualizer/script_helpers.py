@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the backend test scripts
+
+The test scripts talk to a running backend over HTTP; these helpers hold the
+connection and JSON handling they have in common.
+"""
+
+import json
+import requests
+
+# One keep-alive session per script, so back-to-back requests reuse the connection to the backend
+session = requests.Session()
+session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def load_json(response):
+    """Decode a JSON response body."""
+    return response.json()
+
+def format_json(value):
+    """Pretty-print a JSON value with two-space indentation."""
+    return json.dumps(value, indent=2)
@@ -8,63 +8,75 @@ and process the main YAML file.
 
 import os
 import sys
-import json
 import zipfile
 import tempfile
-import requests
 from pathlib import Path
 
+from script_helpers import session, load_json, format_json
+
 # Constants
 BACKEND_URL = "http://localhost:5000/api"
 CONFIG_DIR = "config"
 MAIN_YAML_FILE = "model.yaml"
+# Zips up to this size are built in memory; larger ones spill to a temporary file
+ZIP_SPOOL_MAX_SIZE = int(os.environ.get("ZIP_SPOOL_MAX_SIZE", 32 * 1024 * 1024))
 
 def create_zip_from_folder(folder_path, main_file):
-    """Create a zip file from a folder."""
+    """Create a zip archive of a folder, returned as a file object positioned at its start."""
     print(f"Creating zip file from folder: {folder_path}")
     
-    # Create a temporary file for the zip
-    temp_file = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
-    temp_file.close()
+    # Build the zip in memory instead of writing it to disk and reading it back; only large folders spill
+    zip_buffer = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE, suffix='.zip')
     
-    # Create a zip file
-    with zipfile.ZipFile(temp_file.name, 'w') as zipf:
-        # Walk through the folder and add all files to the zip
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                # Get the relative path
-                rel_path = os.path.relpath(file_path, os.path.dirname(folder_path))
-                print(f"Adding file to zip: {rel_path}")
-                zipf.write(file_path, rel_path)
+    # Create a zip file (stored, not deflated: the YAML files are small and only travel over localhost)
+    with zipfile.ZipFile(zip_buffer, 'w', compression=zipfile.ZIP_STORED) as zipf:
+        # Walk through the folder with scandir, whose entries already know their type, and add all files to the zip.
+        # Archive names are the paths relative to the folder's parent, sliced off a prefix computed once
+        folder_path = os.path.abspath(folder_path)
+        prefix_length = len(os.path.join(os.path.dirname(folder_path), ''))
+        added = []
+        pending_dirs = [folder_path]
+        while pending_dirs:
+            with os.scandir(pending_dirs.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file():
+                        rel_path = entry.path[prefix_length:]
+                        zipf.write(entry.path, rel_path)
+                        added.append(rel_path)
+    print(f"Added {len(added)} files to zip: {', '.join(sorted(added))}")
     
-    return temp_file.name
+    zip_buffer.seek(0)
+    return zip_buffer
 
 def test_upload_folder():
     """Test the /api/yaml/upload-folder endpoint."""
     print("\nTesting /api/yaml/upload-folder endpoint...")
     
-    # Check if the config directory exists
-    if not os.path.exists(CONFIG_DIR):
-        print(f"Error: Config directory not found: {CONFIG_DIR}")
-        return False
-    
-    # Check if the main YAML file exists
+    # Check that the main YAML file exists (which implies the config directory does);
+    # the directory is only looked at again to report which of the two is missing
     main_file_path = os.path.join(CONFIG_DIR, MAIN_YAML_FILE)
-    if not os.path.exists(main_file_path):
-        print(f"Error: Main YAML file not found: {main_file_path}")
+    try:
+        os.stat(main_file_path)
+    except FileNotFoundError:
+        if not os.path.isdir(CONFIG_DIR):
+            print(f"Error: Config directory not found: {CONFIG_DIR}")
+        else:
+            print(f"Error: Main YAML file not found: {main_file_path}")
         return False
     
+    zip_buffer = None
     try:
         # Create a zip file from the config directory
-        zip_file_path = create_zip_from_folder(CONFIG_DIR, MAIN_YAML_FILE)
+        zip_buffer = create_zip_from_folder(CONFIG_DIR, MAIN_YAML_FILE)
         
         # Create a multipart form-data request
-        files = {'zip_file': open(zip_file_path, 'rb')}
+        files = {'zip_file': (f"{os.path.basename(CONFIG_DIR)}.zip", zip_buffer, 'application/zip')}
         data = {'main_file': MAIN_YAML_FILE}
         
         # Make a request to the backend API
-        response = requests.post(
+        response = session.post(
             f"{BACKEND_URL}/yaml/upload-folder",
             files=files,
             data=data
@@ -73,14 +85,14 @@ def test_upload_folder():
         # Check the response
         if response.status_code == 200:
             print("Request successful!")
-            config = response.json()
+            config = load_json(response)
             
             # Check if the config references were resolved
             if 'modules' in config and 'conv1x1_1' in config['modules']:
                 conv1x1_1_config = config['modules']['conv1x1_1']['config']
                 if isinstance(conv1x1_1_config, dict):
                     print("Config reference for conv1x1_1 was successfully resolved:")
-                    print(json.dumps(conv1x1_1_config, indent=2))
+                    print(format_json(conv1x1_1_config))
                     return True
                 else:
                     print("Config reference for conv1x1_1 was not resolved.")
@@ -98,12 +110,9 @@ def test_upload_folder():
         print(f"Error uploading folder: {e}")
         return False
     finally:
-        # Close the file
-        files['zip_file'].close()
-        
-        # Remove the temporary zip file
-        if os.path.exists(zip_file_path):
-            os.remove(zip_file_path)
+        # Close the zip (this also removes its temporary file, if it spilled to disk)
+        if zip_buffer is not None:
+            zip_buffer.close()
 
 def main():
     """Main entry point for the script."""
@@ -10,15 +10,19 @@ This script tests the integration between the backend and frontend by:
 
 import os
 import sys
-import json
 import time
 import subprocess
+import threading
+import collections
 import requests
 from pathlib import Path
 
+from script_helpers import session, load_json, format_json
+
 # Constants
 BACKEND_URL = "http://localhost:5000/api"
 YAML_FILE_PATH = os.path.join("config", "model.yaml")
+SERVER_START_TIMEOUT = 10 # Seconds to wait for the backend to accept requests
 
 def start_backend_server():
     """Start the backend server."""
@@ -38,15 +42,32 @@ def start_backend_server():
         [python_executable, "app.py"],
         cwd=backend_dir,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
     )
     
-    # Wait for the server to start
+    # Keep draining the server's output so it never blocks on a full pipe; the tail is shown if startup fails
+    output_tail = collections.deque(maxlen=50)
+    threading.Thread(target=output_tail.extend, args=(process.stdout,), daemon=True).start()
+    
+    # Poll until the server answers instead of sleeping a fixed time. There is no health endpoint, but any
+    # HTTP response (GET /parse is a cheap 405) means the server is up
     print("Waiting for the backend server to start...")
-    time.sleep(3)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    delay = 0.02
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            session.get(f"{BACKEND_URL}/yaml/parse", timeout=0.2)
+            return process
+        except (requests.ConnectionError, requests.Timeout):
+            pass
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.25)
     
-    return process
+    stop_backend_server(process)
+    print("".join(output_tail))
+    raise RuntimeError("Backend server did not start in time")
 
 def stop_backend_server(process):
     """Stop the backend server."""
@@ -58,27 +79,27 @@ def test_parse_yaml_content():
     """Test the /api/yaml/parse endpoint."""
     print("\nTesting /api/yaml/parse endpoint...")
     
-    # Read the YAML file
-    with open(YAML_FILE_PATH, "r") as f:
-        yaml_content = f.read()
+    # Read the YAML file as bytes; it is sent as the raw request body, not wrapped in JSON
+    yaml_content = Path(YAML_FILE_PATH).read_bytes()
     
     # Make a request to the backend API
-    response = requests.post(
+    response = session.post(
         f"{BACKEND_URL}/yaml/parse",
-        json={"content": yaml_content}
+        data=yaml_content,
+        headers={"Content-Type": "application/x-yaml"}
     )
     
     # Check the response
     if response.status_code == 200:
         print("Request successful!")
-        data = response.json()
+        data = load_json(response)
         
         # Check if the config references were resolved
         if 'modules' in data and 'conv1x1_1' in data['modules']:
             conv1x1_1_config = data['modules']['conv1x1_1']['config']
             if isinstance(conv1x1_1_config, dict):
                 print("Config reference for conv1x1_1 was successfully resolved:")
-                print(json.dumps(conv1x1_1_config, indent=2))
+                print(format_json(conv1x1_1_config))
                 return True
             else:
                 print("Config reference for conv1x1_1 was not resolved.")
@@ -8,29 +8,37 @@ in a YAML configuration file.
 
 import os
 import sys
-import json
-import requests
+import functools
 from pathlib import Path
 
+from script_helpers import session, load_json, format_json
+
 # Constants
 BACKEND_URL = "http://localhost:5000/api"
 YAML_FILE_PATH = "/home/ji-liu/GitHub/visualize_architecture/config/model.yaml" #os.path.join("..", "config", "model.yaml")
 
+@functools.lru_cache(maxsize=None)
+def read_yaml_payload():
+    """Read the YAML file once; both tests upload the same bytes."""
+    return Path(YAML_FILE_PATH).read_bytes()
+
 def test_check_references():
     """Test the /api/yaml/check-references endpoint."""
     print("\nTesting /api/yaml/check-references endpoint...")
     
-    # Check if the YAML file exists
-    if not os.path.exists(YAML_FILE_PATH):
+    # Read the YAML file (a missing file surfaces here, without a separate existence check)
+    try:
+        payload = read_yaml_payload()
+    except FileNotFoundError:
         print(f"Error: YAML file not found: {YAML_FILE_PATH}")
         return False
     
     # Create a multipart form-data request
-    files = {'file': open(YAML_FILE_PATH, 'rb')}
+    files = {'file': (os.path.basename(YAML_FILE_PATH), payload)}
     
     try:
         # Make a request to the backend API
-        response = requests.post(
+        response = session.post(
             f"{BACKEND_URL}/yaml/check-references",
             files=files
         )
@@ -38,7 +46,7 @@ def test_check_references():
         # Check the response
         if response.status_code == 200:
             print("Request successful!")
-            data = response.json()
+            data = load_json(response)
             
             # Check if references were found
             if 'references' in data and 'count' in data:
@@ -56,26 +64,25 @@ def test_check_references():
     except Exception as e:
         print(f"Error checking references: {e}")
         return False
-    finally:
-        # Close the file
-        files['file'].close()
 
 def test_upload_with_references():
     """Test the /api/yaml/upload endpoint with auto_upload_references=true."""
     print("\nTesting /api/yaml/upload endpoint with auto_upload_references=true...")
     
-    # Check if the YAML file exists
-    if not os.path.exists(YAML_FILE_PATH):
+    # Read the YAML file (a missing file surfaces here, without a separate existence check)
+    try:
+        payload = read_yaml_payload()
+    except FileNotFoundError:
         print(f"Error: YAML file not found: {YAML_FILE_PATH}")
         return False
     
     # Create a multipart form-data request
-    files = {'file': open(YAML_FILE_PATH, 'rb')}
+    files = {'file': (os.path.basename(YAML_FILE_PATH), payload)}
     data = {'auto_upload_references': 'true'}
     
     try:
         # Make a request to the backend API
-        response = requests.post(
+        response = session.post(
             f"{BACKEND_URL}/yaml/upload",
             files=files,
             data=data
@@ -84,14 +91,14 @@ def test_upload_with_references():
         # Check the response
         if response.status_code == 200:
             print("Request successful!")
-            config = response.json()
+            config = load_json(response)
             
             # Check if the config references were resolved
             if 'modules' in config and 'conv1x1_1' in config['modules']:
                 conv1x1_1_config = config['modules']['conv1x1_1']['config']
                 if isinstance(conv1x1_1_config, dict):
                     print("Config reference for conv1x1_1 was successfully resolved:")
-                    print(json.dumps(conv1x1_1_config, indent=2))
+                    print(format_json(conv1x1_1_config))
                     return True
                 else:
                     print("Config reference for conv1x1_1 was not resolved.")
@@ -108,9 +115,6 @@ def test_upload_with_references():
     except Exception as e:
         print(f"Error uploading YAML file: {e}")
         return False
-    finally:
-        # Close the file
-        files['file'].close()
 
 def main():
     """Main entry point for the script."""